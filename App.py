@@ -3,8 +3,10 @@ Complete Flask Application - Student AI Assistant
 Main application file with all routes and integrations
 """
 
-from flask import Flask, render_template, request, jsonify, session, send_file, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, send_file, redirect, url_for, Response, stream_with_context
 import os
+import json
+import hashlib
 import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
@@ -16,12 +18,18 @@ from Parts.Drive_Manager import DriveManagerAI
 from Parts.Health_Tracker import HealthTrackerAI
 from Parts.Quiz_Generator import QuizGeneratorAI
 from Parts.Search_Engine import SearchEngineAI
+from Parts.Gemini_Gateway import get_gateway
+from Parts.Semantic_Cache import get_semantic_cache
+from Parts.Question_Bank import get_question_bank
+from Parts.Quiz_Pool import QuizPool
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
+# Largest page /api/notes/view returns; bigger limits are capped to it
+NOTES_MAX_PAGE_SIZE = int(os.getenv('NOTES_MAX_PAGE_SIZE', '500'))
 
 # Configure logging
 logging.basicConfig(
@@ -55,12 +63,57 @@ try:
     drive_manager = DriveManagerAI(GEMINI_API_KEY, CLOUDINARY_CONFIG)
     health_tracker = HealthTrackerAI(GEMINI_API_KEY)
     quiz_generator = QuizGeneratorAI(GEMINI_API_KEY)
+    quiz_pool = QuizPool(quiz_generator)
     search_engine = SearchEngineAI(GEMINI_API_KEY)
     print("✅ All AI modules initialized successfully")
 except Exception as e:
     print(f"⚠️ Warning: AI modules initialization error: {e}")
     print("⚠️ App will run but AI features may not work")
 
+# ==================== HELPERS ====================
+
+def sse_response(events):
+    """Wrap a generator of {'event', 'data'} dicts as a Server-Sent Events response"""
+    def generate():
+        for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def conditional_json(version, build):
+    """Serve build() as JSON with an ETag derived from version, or 304 if the client has it
+    
+    version must be cheap to compute and change whenever the payload would; build() only
+    runs when the client's copy is stale. The version is read first, so a write racing
+    with build() can only make the ETag older than the data, never newer.
+    """
+    etag = hashlib.sha1(json.dumps(version, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:24]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        result = build()
+        response = jsonify(result)
+        if not result.get('success', True):
+            return response
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def iter_body_lines(stream, chunk_size=1 << 16):
+    """Yield the lines of a request body, reading it in large chunks"""
+    buffer = b''
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        yield from lines
+    if buffer:
+        yield buffer
+
 # ==================== MAIN ROUTES ====================
 
 @app.route('/')
@@ -93,12 +146,39 @@ def create_note():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/notes/topics', methods=['GET'])
+def list_note_topics():
+    try:
+        result = notes_ai.list_topics()
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/notes/view', methods=['POST'])
 def view_notes():
     try:
         data = request.json
-        result = notes_ai.view_notes(data.get('topic'))
-        return jsonify(result)
+        topic = data.get('topic')
+        limit = data.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                limit = 0
+            if limit <= 0:
+                return jsonify({'success': False, 'message': 'limit must be a positive integer'}), 400
+            limit = min(limit, NOTES_MAX_PAGE_SIZE)
+        after_id = data.get('after_id')
+        if after_id is not None:
+            try:
+                after_id = int(after_id)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': 'after_id must be an integer'}), 400
+        newest_first = data.get('newest_first', False)
+        return conditional_json(
+            ['notes', topic, notes_ai.notes_version(topic), limit, after_id, newest_first],
+            lambda: notes_ai.view_notes(topic, limit, after_id, newest_first)
+        )
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -129,11 +209,47 @@ def edit_note():
 def search_notes():
     try:
         data = request.json
-        result = notes_ai.search_notes(data.get('topic'), data.get('keyword'))
+        result = notes_ai.search_notes(
+            data.get('topic'),
+            data.get('keyword'),
+            data.get('fuzzy', False)
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/notes/search-all', methods=['POST'])
+def search_all_notes():
+    try:
+        data = request.json
+        result = notes_ai.search_all_notes(
+            data.get('query', ''),
+            data.get('mode', 'and'),
+            data.get('limit', 20),
+            data.get('topic'),
+            data.get('fuzzy', False)
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/notes/import', methods=['POST'])
+def import_notes():
+    try:
+        # Stream the NDJSON body instead of loading it whole
+        result = notes_ai.import_notes(iter_body_lines(request.stream))
+        return jsonify(result), (200 if result['success'] else 500)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/notes/export', methods=['GET'])
+def export_notes():
+    return Response(
+        stream_with_context(notes_ai.export_notes(request.args.get('topic'))),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename=notes.ndjson'}
+    )
+
 @app.route('/api/notes/summarize', methods=['POST'])
 def summarize_notes():
     try:
@@ -152,6 +268,22 @@ def ask_ai_notes():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/notes/summarize/stream', methods=['POST'])
+def summarize_notes_stream():
+    try:
+        data = request.json
+        return sse_response(notes_ai.stream_summarize_notes(data.get('topic')))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/notes/ask-ai/stream', methods=['POST'])
+def ask_ai_notes_stream():
+    try:
+        data = request.json
+        return sse_response(notes_ai.stream_ask_ai_about_notes(data.get('topic'), data.get('question')))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/notes/flashcards', methods=['POST'])
 def generate_flashcards():
     try:
@@ -161,6 +293,14 @@ def generate_flashcards():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/notes/flashcards/stream', methods=['POST'])
+def generate_flashcards_stream():
+    try:
+        data = request.json
+        return sse_response(notes_ai.stream_flashcards(data.get('topic')))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # ==================== DRIVE MANAGER ROUTES ====================
 
 @app.route('/drive')
@@ -217,12 +357,11 @@ def add_link():
 def list_files():
     try:
         data = request.json
-        result = drive_manager.list_files(
-            data.get('semester'),
-            data.get('degree'),
-            data.get('subject')
+        semester, degree, subject = data.get('semester'), data.get('degree'), data.get('subject')
+        return conditional_json(
+            ['drive', drive_manager.files_version(), semester, degree, subject],
+            lambda: drive_manager.list_files(semester, degree, subject)
         )
-        return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -239,8 +378,23 @@ def delete_file():
 def get_predefined_link():
     try:
         data = request.json
-        result = drive_manager.get_predefined_link(data.get('semester'), data.get('subject'))
-        return jsonify(result)
+        semester, subject = data.get('semester'), data.get('subject')
+        return conditional_json(
+            ['predefined', drive_manager.predefined_version, semester, subject],
+            lambda: drive_manager.get_predefined_link(semester, subject)
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/drive/study-plan/stream', methods=['POST'])
+def study_plan_stream():
+    try:
+        data = request.json
+        return sse_response(drive_manager.stream_ai_study_plan(
+            data.get('semester'),
+            data.get('degree'),
+            data.get('subjects', [])
+        ))
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -300,7 +454,8 @@ def generate_quiz_notes():
             data.get('topic'),
             data.get('num_questions', 5),
             data.get('difficulty', 'medium'),
-            data.get('quiz_type', 'mixed')
+            data.get('quiz_type', 'mixed'),
+            data.get('use_bank', True)
         )
         return jsonify(result)
     except Exception as e:
@@ -310,23 +465,69 @@ def generate_quiz_notes():
 def generate_quiz_topic():
     try:
         data = request.json
-        result = quiz_generator.generate_quiz_from_topic(
+        pooled = quiz_pool.pop(
             data.get('topic'),
             data.get('num_questions', 5),
             data.get('difficulty', 'medium'),
             data.get('quiz_type', 'mixed')
         )
+        if pooled:
+            return jsonify(pooled)
+        result = quiz_generator.generate_quiz_from_topic(
+            data.get('topic'),
+            data.get('num_questions', 5),
+            data.get('difficulty', 'medium'),
+            data.get('quiz_type', 'mixed'),
+            data.get('use_bank', True)
+        )
         return jsonify(result)
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/quiz/generate-from-notes/stream', methods=['POST'])
+def generate_quiz_notes_stream():
+    try:
+        data = request.json
+        return sse_response(quiz_generator.stream_quiz_from_notes(
+            data.get('topic'),
+            data.get('num_questions', 5),
+            data.get('difficulty', 'medium'),
+            data.get('quiz_type', 'mixed'),
+            data.get('use_bank', True)
+        ))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/quiz/generate-from-topic/stream', methods=['POST'])
+def generate_quiz_topic_stream():
+    try:
+        data = request.json
+        pooled = quiz_pool.pop(
+            data.get('topic'),
+            data.get('num_questions', 5),
+            data.get('difficulty', 'medium'),
+            data.get('quiz_type', 'mixed')
+        )
+        if pooled:
+            return sse_response(quiz_generator.stream_ready_quiz(pooled))
+        return sse_response(quiz_generator.stream_quiz_from_topic(
+            data.get('topic'),
+            data.get('num_questions', 5),
+            data.get('difficulty', 'medium'),
+            data.get('quiz_type', 'mixed'),
+            data.get('use_bank', True)
+        ))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/quiz/evaluate', methods=['POST'])
 def evaluate_quiz():
     try:
         data = request.json
         result = quiz_generator.evaluate_quiz(
             data.get('questions'),
-            data.get('answers')
+            data.get('answers'),
+            data.get('feedback_mode')
         )
         
         if result['success']:
@@ -342,6 +543,21 @@ def evaluate_quiz():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/quiz/evaluate-class', methods=['POST'])
+def evaluate_class_quiz():
+    try:
+        data = request.json
+        result = quiz_generator.evaluate_class(
+            data.get('questions'),
+            data.get('submissions'),
+            data.get('topic', 'Unknown'),
+            data.get('class_feedback', True),
+            data.get('save_reports', True)
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # ==================== SEARCH ENGINE ROUTES ====================
 
 @app.route('/search')
@@ -385,6 +601,20 @@ def manage_todo():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+# ==================== SYSTEM ROUTES ====================
+
+@app.route('/api/ai/stats', methods=['GET'])
+def ai_stats():
+    """Gemini gateway and response cache counters"""
+    try:
+        stats = get_gateway().get_stats()
+        stats['semantic_cache'] = get_semantic_cache().get_stats()
+        stats['question_bank'] = get_question_bank().get_stats()
+        stats['quiz_pool'] = quiz_pool.get_stats()
+        return jsonify({'success': True, 'stats': stats})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
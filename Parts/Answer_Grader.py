@@ -0,0 +1,467 @@
+"""
+Short Answer Grader
+Features: Batch scoring of free-text answers against reference answers with hashed sparse
+n-gram vectors (cosine) plus key-term F1 overlap, computed with NumPy; negation checks,
+exact matching for short symbolic answers and per-type thresholds
+"""
+
+import os
+import re
+import sys
+import time
+import zlib
+import difflib
+import threading
+from functools import lru_cache
+import numpy as np
+
+FEATURE_BITS = 20
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+# Weights of the two signals in the final score
+COSINE_WEIGHT = float(os.getenv('GRADER_COSINE_WEIGHT', '0.6'))
+OVERLAP_WEIGHT = 1.0 - COSINE_WEIGHT
+
+# Score multiplier when exactly one of answer and reference is negated
+NEGATION_FACTOR = float(os.getenv('GRADER_NEGATION_FACTOR', '0.5'))
+
+# References of at most this many words that contain digits or symbols ('O(log n)', '3.14')
+# must match exactly after normalization; n-gram similarity can't tell them apart
+EXACT_MAX_WORDS = int(os.getenv('GRADER_EXACT_MAX_WORDS', '4'))
+
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'it', 'its', 'of', 'to', 'in',
+    'on', 'at', 'by', 'for', 'and', 'that', 'this', 'as', 'which'
+}
+
+# Spelled-out numbers and a few common equivalents map to one canonical token
+CANONICAL = {
+    'zero': '0', 'one': '1', 'two': '2', 'three': '3', 'four': '4', 'five': '5',
+    'six': '6', 'seven': '7', 'eight': '8', 'nine': '9', 'ten': '10',
+    'yes': 'true', 'correct': 'true', 'no': 'false', 'incorrect': 'false',
+    'percent': '%', 'pct': '%'
+}
+
+
+def _parse_thresholds(spec):
+    """'SHORT=0.6,FILL=0.8' -> {'SHORT': 0.6, 'FILL': 0.8}"""
+    thresholds = {}
+    for part in spec.split(','):
+        if '=' in part:
+            qtype, value = part.split('=', 1)
+            thresholds[qtype.strip().upper()] = float(value)
+    return thresholds
+
+
+# Question types graded by similarity, and the score an answer needs to count as correct.
+# Types not listed here (MCQ, TF) keep exact matching.
+DEFAULT_THRESHOLDS = {'SHORT': 0.6}
+DEFAULT_THRESHOLDS.update(_parse_thresholds(os.getenv('QUIZ_GRADE_THRESHOLDS', '')))
+
+
+# Texts of a batch are joined with SEPARATOR and tokenized in a single regex pass
+SEPARATOR = '\x01'
+_TOKEN_RE = re.compile(r'[a-z0-9%]+|\x01')
+_CONTRACTION_RE = re.compile(r"n['\u2019]t\b")
+
+_NEGATION_RE = re.compile(r"\b(?:not|no|never|none|nothing|neither|nor|cannot|without)\b|n['\u2019]t\b")
+# Operators, or a number that isn't part of a word ('ipv4' and 'h2o' are words)
+_SYMBOL_RE = re.compile(r'[()\[\]^*/+=<>%]|(?<![a-z])[0-9]')
+_WORD_RE = re.compile(r'[a-z]+')
+_SPACE_RE = re.compile(r'\s+')
+# A hyphen joining words ('2-phase', 'one-to-one') is spacing; '5-3' is still a minus
+_WORD_HYPHEN_RE = re.compile(r'(?<=[a-z0-9])-(?=[a-z])|(?<=[a-z])-(?=[0-9])')
+
+# Multiplier for combining two word hashes into a bigram feature
+_BIGRAM_MIX = 2654435761
+
+
+def _stem(token):
+    """Very light suffix stripping so 'arrays'/'array', 'classes'/'class' and 'sorting'/'sorted'/'sort' agree"""
+    if token.endswith('ss'):
+        return token
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            # '-es' is only a plural ending after s/x/z/ch/sh ('classes', 'boxes'); 'queues' -> 'queue'
+            if suffix == 'es' and not token[:-2].endswith(('s', 'x', 'z', 'ch', 'sh')):
+                continue
+            return token[:-len(suffix)]
+    return token
+
+
+@lru_cache(maxsize=65536)
+def _is_negated(text):
+    """Whether a text contains an odd number of negations; a lone 'no' is an answer, not a negation"""
+    text = text.lower()
+    return text.strip(' .!') != 'no' and len(_NEGATION_RE.findall(text)) % 2 == 1
+
+
+@lru_cache(maxsize=65536)
+def _normalize_exact(text):
+    """Lowercase text without whitespace, word hyphens or edge punctuation, with spelled-out numbers as digits"""
+    text = _WORD_HYPHEN_RE.sub(' ', text.lower())
+    text = _WORD_RE.sub(lambda match: CANONICAL.get(match.group(), match.group()), text)
+    return _SPACE_RE.sub('', text).strip('.,;:!?\'"')
+
+
+def _needs_exact(reference):
+    """Whether a reference is a short symbolic or numeric answer that must match exactly
+
+    Decided on the reference as written: 'three layers' is prose, '3 layers' is a number.
+    """
+    return len(reference.split()) <= EXACT_MAX_WORDS and bool(_SYMBOL_RE.search(reference.lower()))
+
+
+@lru_cache(maxsize=65536)
+def _token_info(raw):
+    """(is stopword, word hash, character trigram hashes) of one raw lowercase token"""
+    token = CANONICAL.get(raw, raw)
+    stop = token in STOPWORDS
+    token = _stem(token)
+    word = zlib.crc32(('w:' + token).encode('utf-8')) & FEATURE_MASK
+    padded = f"#{token}#"
+    trigrams = tuple(
+        zlib.crc32(('c:' + padded[i:i + 3]).encode('utf-8')) & FEATURE_MASK
+        for i in range(len(padded) - 2)
+    )
+    return stop, word, trigrams
+
+
+def _tokenize_batch(texts):
+    """Content words of every text as parallel arrays (row, word hash) plus trigram tables
+
+    Each distinct token is normalized and hashed once per batch; stopwords are dropped
+    unless a text consists of nothing else.
+    """
+    texts = [str(text or '') for text in texts]
+    joined = SEPARATOR.join(texts)
+    if joined.count(SEPARATOR) != len(texts) - 1:
+        joined = SEPARATOR.join(text.replace(SEPARATOR, ' ') for text in texts)
+
+    vocabulary = {SEPARATOR: 0}
+    token_ids = np.array(
+        [vocabulary.setdefault(word, len(vocabulary))
+         for word in _TOKEN_RE.findall(_CONTRACTION_RE.sub(' not', joined.lower()))],
+        dtype=np.int64
+    )
+    separators = token_ids == 0
+    rows = np.cumsum(separators)[~separators]
+    tokens = token_ids[~separators] - 1
+    del vocabulary[SEPARATOR]
+
+    infos = [_token_info(word) for word in vocabulary]
+    stop = np.array([info[0] for info in infos], dtype=bool)
+    word_hash = np.array([info[1] for info in infos], dtype=np.int64)
+    trigram_counts = np.array([len(info[2]) for info in infos], dtype=np.int64)
+    trigram_start = np.concatenate(([0], np.cumsum(trigram_counts)[:-1])).astype(np.int64) \
+        if infos else np.zeros(0, dtype=np.int64)
+    trigram_hash = np.fromiter((h for info in infos for h in info[2]), dtype=np.int64,
+                               count=int(trigram_counts.sum()))
+
+    if len(tokens):
+        is_stop = stop[tokens]
+        content = np.bincount(rows, weights=~is_stop, minlength=len(texts))
+        keep = ~is_stop | (content[rows] == 0)
+        tokens, rows = tokens[keep], rows[keep]
+    return rows, tokens, word_hash, trigram_start, trigram_counts, trigram_hash
+
+
+def _sparse_rows(batch):
+    """Sparse vectors for a batch: sorted unique keys (row << FEATURE_BITS | feature) and weights
+
+    Word unigrams and character trigrams make the vector independent of word order and
+    tolerant of typos; adjacent-word bigrams add a little weight for matching phrasing.
+    """
+    rows, tokens, word_hash, trigram_start, trigram_counts, trigram_hash = batch
+    if not len(tokens):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    words = word_hash[tokens]
+
+    # Character trigrams: expand each token occurrence into its run of the trigram table
+    counts = trigram_counts[tokens]
+    total = int(counts.sum())
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    trigrams = trigram_hash[np.repeat(trigram_start[tokens], counts) + offsets]
+    trigram_rows = np.repeat(rows, counts)
+
+    # Bigrams of neighbouring words within the same text
+    same_row = rows[1:] == rows[:-1]
+    bigrams = ((words[:-1][same_row] * _BIGRAM_MIX) ^ (words[1:][same_row] + 1)) & FEATURE_MASK
+
+    keys = np.concatenate((
+        (rows << FEATURE_BITS) | words,
+        (trigram_rows << FEATURE_BITS) | trigrams,
+        (rows[1:][same_row] << FEATURE_BITS) | bigrams
+    ))
+    weights = np.concatenate((
+        np.ones(len(words)),
+        np.full(total, 0.5),
+        np.full(len(bigrams), 0.5)
+    ))
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights)
+
+
+def _word_sets(batch):
+    """Sorted unique keys (row << FEATURE_BITS | word hash) for each text's set of words"""
+    rows, tokens, word_hash = batch[:3]
+    return np.unique((rows << FEATURE_BITS) | word_hash[tokens])
+
+
+def _row_dot(keys_a, values_a, keys_b, values_b, count):
+    """Per-row dot products of two sparse batches"""
+    _, index_a, index_b = np.intersect1d(keys_a, keys_b, assume_unique=True, return_indices=True)
+    return np.bincount(keys_a[index_a] >> FEATURE_BITS, weights=values_a[index_a] * values_b[index_b],
+                       minlength=count)
+
+
+def score_answers(answers, references):
+    """Similarity in [0, 1] of each answer to its reference answer, as a NumPy array
+
+    score = COSINE_WEIGHT * cosine(n-gram vectors) + OVERLAP_WEIGHT * F1 of the answer's
+    and the reference's content words, so extra terms cost as much as missing ones. The
+    score is multiplied by NEGATION_FACTOR when only one side is negated, and short
+    symbolic or numeric references ('O(log n)', '42') score 1 or 0 on an exact match.
+    """
+    count = len(answers)
+    if count != len(references):
+        raise ValueError('answers and references must have the same length')
+    if count == 0:
+        return np.zeros(0)
+
+    answer_batch = _tokenize_batch(answers)
+    reference_batch = _tokenize_batch(references)
+
+    keys_a, values_a = _sparse_rows(answer_batch)
+    keys_r, values_r = _sparse_rows(reference_batch)
+    dot = _row_dot(keys_a, values_a, keys_r, values_r, count)
+    norm_a = np.bincount(keys_a >> FEATURE_BITS, weights=values_a ** 2, minlength=count)
+    norm_r = np.bincount(keys_r >> FEATURE_BITS, weights=values_r ** 2, minlength=count)
+    denominator = np.sqrt(norm_a * norm_r)
+    cosine = np.divide(dot, denominator, out=np.zeros(count), where=denominator > 0)
+
+    words_a = _word_sets(answer_batch)
+    words_r = _word_sets(reference_batch)
+    shared = np.bincount(np.intersect1d(words_a, words_r, assume_unique=True) >> FEATURE_BITS,
+                         minlength=count)
+    sizes = np.bincount(words_a >> FEATURE_BITS, minlength=count) + \
+        np.bincount(words_r >> FEATURE_BITS, minlength=count)
+    overlap = np.divide(2.0 * shared, sizes, out=np.zeros(count), where=sizes > 0)
+
+    scores = COSINE_WEIGHT * cosine + OVERLAP_WEIGHT * overlap
+    answers = [str(answer or '') for answer in answers]
+    references = [str(reference or '') for reference in references]
+    negated = np.array([_is_negated(answer) != _is_negated(reference)
+                        for answer, reference in zip(answers, references)], dtype=bool)
+    scores[negated] *= NEGATION_FACTOR
+    for i, reference in enumerate(references):
+        if _needs_exact(reference):
+            scores[i] = float(_normalize_exact(answers[i]) == _normalize_exact(reference))
+
+    return np.clip(scores, 0.0, 1.0)
+
+
+class AnswerGrader:
+    """Grades batches of (question type, answer, reference) with per-type thresholds"""
+
+    def __init__(self, thresholds=None):
+        """thresholds: {question type: minimum score}; types not listed use exact matching"""
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+
+    def uses_similarity(self, qtype):
+        """Whether answers to this question type are graded by score"""
+        return str(qtype or 'SHORT').upper() in self.thresholds
+
+    def grade(self, qtypes, answers, references):
+        """(scores, is_correct) arrays for a batch graded by similarity"""
+        scores = score_answers(answers, references)
+        thresholds = np.array([self.thresholds.get(str(qtype or 'SHORT').upper(), 1.0) for qtype in qtypes])
+        return scores, scores >= thresholds
+
+
+_grader = None
+_grader_lock = threading.Lock()
+
+
+def get_answer_grader():
+    """Get the process-wide grader"""
+    global _grader
+    with _grader_lock:
+        if _grader is None:
+            _grader = AnswerGrader()
+        return _grader
+
+
+# ==================== BENCHMARK ====================
+
+# (answer, reference, should_be_correct) the weights and thresholds were tuned on: extra or
+# missing key terms, negation, symbolic answers that differ by a character, and the answer
+# variants a student may write. Run 'python -m Parts.Answer_Grader cases' after changing them.
+TUNING_CASES = [
+    ("stack queue heap tree", "heap", False),
+    ("tcp udp ip", "tcp", False),
+    ("it is not a stack", "stack", False),
+    ("it isn't a stack", "stack", False),
+    ("O(n)", "O(log n)", False),
+    ("O(n log n)", "O(n^2)", False),
+    ("O(n^2)", "O(n)", False),
+    ("6", "five", False),
+    ("3.41", "3.14", False),
+    ("queue", "stack", False),
+    ("the kernel never schedules threads", "the kernel schedules threads", False),
+    ("depth first search", "breadth first search", False),
+    ("heap", "heap", True),
+    ("Heap.", "heap", True),
+    ("a heap", "heap", True),
+    ("classes", "class", True),
+    ("processes", "process", True),
+    ("queues", "queue", True),
+    ("o(LOG N).", "O(log n)", True),
+    ("O(n ^ 2)", "O(n^2)", True),
+    ("5", "five", True),
+    ("3.14", "3.14", True),
+    ("not a queue", "not a queue", True),
+    ("it is not sorted", "it isn't sorted", True),
+    ("tree search binary", "binary search tree", True),
+    ("binary serach tree", "binary search tree", True),
+    ("kernel schedules the threads", "the kernel schedules threads", True),
+    ("the sorted array", "sorting arrays", True),
+    ("last in, first out", "Last in first out", True),
+    ("mutual exclusion", "mutual exclusion lock", True),
+]
+
+
+# Held-out terms for the timing and accuracy benchmark: none of them appear in
+# TUNING_CASES
+BENCHMARK_TERMS = (
+    'hash table', 'linked list', 'round robin scheduling', 'virtual memory', 'page fault',
+    'dynamic programming', 'garbage collection', 'primary key', 'foreign key', 'deadlock',
+    'semaphore', 'context switch', 'cache miss', 'branch prediction', 'instruction pipelining',
+    'recursion', 'polymorphism', 'inheritance', 'encapsulation', 'abstract class', 'compiler',
+    'interpreter', 'lexical analysis', 'public key encryption', 'symmetric encryption',
+    'digital signature', 'checksum', 'domain name system', 'load balancer', 'firewall',
+    'quick sort', 'merge sort', 'insertion sort', 'selection sort', 'topological sort',
+    'shortest path', 'minimum spanning tree', 'graph coloring', 'gradient descent',
+    'overfitting', 'regularization', 'decision tree', 'neural network', 'supervised learning',
+    'unsupervised learning', 'database index', 'transaction isolation', 'race condition',
+    'memory leak', 'stack overflow', 'bit masking', 'two complement', 'floating point',
+    'operating system', 'file system', 'device driver', 'interrupt handler', 'system call',
+    'message passing', 'shared memory'
+)
+BENCHMARK_NUMBERS = ('8 bits', '16 bits', '32 bits', '64 bits', '4 bytes', '2 layers', '7 layers',
+                     '3 states', '5 stages', '10 rounds', '1024', '256', '0.5', '2.71')
+_BENCHMARK_PREFIXES = ('', 'a ', 'the ', 'it is a ', 'i think ', 'answer: ')
+_BENCHMARK_SUFFIXES = ('', '.', '!')
+
+
+def _typo(term):
+    """term with two adjacent letters of its longest word swapped"""
+    words = term.split()
+    i = max(range(len(words)), key=lambda k: len(words[k]))
+    word = words[i]
+    j = len(word) // 2
+    words[i] = word[:j - 1] + word[j] + word[j - 1] + word[j + 1:]
+    return ' '.join(words)
+
+
+def make_benchmark_pairs(count, seed=7):
+    """Up to count distinct (answer, reference, should_be_correct) triples from BENCHMARK_TERMS
+
+    Half are correct variants (case, articles, filler, plurals, a typo, spelled-out numbers),
+    half are wrong (another term, often sharing a word, a negation, another number).
+    """
+    import random
+    rng = random.Random(seed)
+    correct, wrong = set(), set()
+    for term in BENCHMARK_TERMS:
+        forms = {term, term.upper(), term.capitalize(), _typo(term)}
+        if not term.endswith(('s', 'x', 'y', 'h', 'ing')):
+            forms.add(term + 's')
+        for form in forms:
+            for prefix in _BENCHMARK_PREFIXES:
+                for suffix in _BENCHMARK_SUFFIXES:
+                    correct.add((prefix + form + suffix, term, True))
+        for negation in ('not a ', 'it is not a ', "it isn't a ", 'never a '):
+            wrong.add((negation + term, term, False))
+        for other in BENCHMARK_TERMS:
+            if other != term:
+                prefix = rng.choice(_BENCHMARK_PREFIXES)
+                wrong.add((prefix + other + rng.choice(_BENCHMARK_SUFFIXES), term, False))
+    for number in BENCHMARK_NUMBERS:
+        head, _, tail = number.partition(' ')
+        spelled = {'2': 'two', '3': 'three', '4': 'four', '5': 'five', '7': 'seven', '8': 'eight', '10': 'ten'}
+        forms = {number, number + '.', ' '.join(filter(None, (spelled.get(head, head), tail)))}
+        for form in forms:
+            correct.add((form, number, True))
+        for other in BENCHMARK_NUMBERS:
+            if other != number:
+                wrong.add((other, number, False))
+
+    correct, wrong = sorted(correct), sorted(wrong)
+    rng.shuffle(correct)
+    rng.shuffle(wrong)
+    half = min(count // 2, len(correct), len(wrong))
+    pairs = correct[:half] + wrong[:half]
+    rng.shuffle(pairs)
+    return pairs
+
+
+def benchmark(count=5000):
+    """Time and accuracy of difflib ratio > 0.7 vs the vectorized grader on up to count held-out pairs"""
+    pairs = make_benchmark_pairs(count)
+    count = len(pairs)
+    answers = [pair[0] for pair in pairs]
+    references = [pair[1] for pair in pairs]
+    expected = np.array([pair[2] for pair in pairs])
+
+    started = time.perf_counter()
+    difflib_correct = np.array([
+        difflib.SequenceMatcher(None, answer.lower().strip(), reference.lower().strip()).ratio() > 0.7
+        for answer, reference in zip(answers, references)
+    ])
+    difflib_seconds = time.perf_counter() - started
+
+    for cached in (_token_info, _is_negated, _normalize_exact):
+        cached.cache_clear()
+    grader = AnswerGrader({'SHORT': DEFAULT_THRESHOLDS.get('SHORT', 0.6)})
+    started = time.perf_counter()
+    _, grader_correct = grader.grade(['SHORT'] * count, answers, references)
+    grader_seconds = time.perf_counter() - started
+
+    return {
+        'pairs': count,
+        'difflib_ms': round(difflib_seconds * 1000, 1),
+        'grader_ms': round(grader_seconds * 1000, 1),
+        'speedup': round(difflib_seconds / grader_seconds, 1) if grader_seconds else None,
+        'difflib_accuracy': round(float((difflib_correct == expected).mean()), 3),
+        'grader_accuracy': round(float((grader_correct == expected).mean()), 3)
+    }
+
+
+def main():
+    """Command line: python -m Parts.Answer_Grader bench [pairs] | cases | score ANSWER REFERENCE"""
+    args = sys.argv[1:]
+    if args and args[0] == 'score' and len(args) == 3:
+        print(f"score: {score_answers([args[1]], [args[2]])[0]:.3f}")
+        return
+    if args and args[0] == 'cases':
+        scores = score_answers([case[0] for case in TUNING_CASES], [case[1] for case in TUNING_CASES])
+        threshold = DEFAULT_THRESHOLDS.get('SHORT', 0.6)
+        wrong = [(case, score) for case, score in zip(TUNING_CASES, scores) if (score >= threshold) != case[2]]
+        for (answer, reference, expected), score in wrong:
+            print(f"{'should pass' if expected else 'should fail'}: {answer!r} vs {reference!r} ({score:.3f})")
+        print(f"{len(TUNING_CASES) - len(wrong)}/{len(TUNING_CASES)} tuning cases graded as expected")
+        return
+    if args and args[0] == 'bench':
+        counts = [int(args[1])] if len(args) > 1 else [100, 1000, 5000]
+        for count in counts:
+            result = benchmark(count)
+            print(f"{result['pairs']:>6} pairs | difflib {result['difflib_ms']:>8} ms "
+                  f"(accuracy {result['difflib_accuracy']:.3f}) | grader {result['grader_ms']:>7} ms "
+                  f"(accuracy {result['grader_accuracy']:.3f}) | {result['speedup']}x")
+        return
+    print("Usage: python -m Parts.Answer_Grader bench [pairs] | cases | score ANSWER REFERENCE")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,14 @@ Features: Upload files, add links, organize by semester/degree/subject, cloud st
 
 import os
 import json
+import time
+import hashlib
 import logging
+import threading
 from datetime import datetime
 from urllib.parse import urlparse
 import webbrowser
-import google.generativeai as genai
+from Parts.Gemini_Gateway import get_gateway
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -26,8 +29,8 @@ class DriveManagerAI:
     def __init__(self, gemini_api_key, cloudinary_config=None):
         """Initialize Drive Manager with AI and cloud storage"""
         self.gemini_api_key = gemini_api_key
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        self.gateway = get_gateway(gemini_api_key)
+        self.model = self.gateway.model('gemini-2.0-flash-exp')
         
         # Configure Cloudinary
         if cloudinary_config and all(cloudinary_config.values()):
@@ -40,8 +43,15 @@ class DriveManagerAI:
         self.local_storage = 'drive_files'
         os.makedirs(self.local_storage, exist_ok=True)
         
+        # Write counter for cheap change detection (ETags)
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        
         # Predefined Google Drive links
         self.predefined_links = self._load_predefined_links()
+        self.predefined_version = hashlib.sha1(
+            json.dumps(self.predefined_links, sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
     
     def _load_predefined_links(self):
         """Load predefined course material links"""
@@ -80,10 +90,25 @@ class DriveManagerAI:
         try:
             with open(self.database_file, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=2, ensure_ascii=False)
+            with self._writes_lock:
+                self._writes += 1
         except Exception as e:
             logging.error(f"Error saving database: {str(e)}")
             raise
     
+    def files_version(self):
+        """Version of the file database without reading it
+        
+        The write counter covers this process; the file's mtime and size cover writes
+        made by other worker processes.
+        """
+        try:
+            stat = os.stat(self.database_file)
+            file_part = f"{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            file_part = "empty"
+        return f"{self._writes}:{file_part}"
+    
     def upload_file(self, file_path, semester, degree, subject, description='', use_cloud=True):
         """Upload file to cloud or local storage"""
         try:
@@ -396,7 +421,49 @@ class DriveManagerAI:
     def get_ai_study_plan(self, semester, degree, subjects):
         """Generate study plan using AI"""
         try:
-            prompt = f"""Create a study plan for a {degree} student in semester {semester}.
+            prompt = self._build_study_plan_prompt(semester, degree, subjects)
+            
+            response = self.model.generate_content(prompt)
+            study_plan = response.text
+            
+            logging.info(f"Study plan generated for {degree} semester {semester}")
+            return {'success': True, 'study_plan': study_plan}
+        except Exception as e:
+            logging.error(f"Error generating study plan: {str(e)}")
+            return {'success': False, 'message': str(e)}
+    
+    def stream_ai_study_plan(self, semester, degree, subjects):
+        """Stream a study plan as SSE-style events"""
+        try:
+            prompt = self._build_study_plan_prompt(semester, degree, subjects)
+            started = time.time()
+            first_chunk_at = None
+            chars = 0
+            
+            for text in self.model.stream_text(prompt):
+                if first_chunk_at is None:
+                    first_chunk_at = time.time()
+                chars += len(text)
+                yield {'event': 'chunk', 'data': {'text': text}}
+            
+            yield {'event': 'done', 'data': {
+                'success': True,
+                'semester': semester,
+                'degree': degree,
+                'subjects': subjects,
+                'chars': chars,
+                'first_chunk_ms': round((first_chunk_at - started) * 1000) if first_chunk_at else None,
+                'total_ms': round((time.time() - started) * 1000)
+            }}
+            
+            logging.info(f"Study plan streamed for {degree} semester {semester}")
+        except Exception as e:
+            logging.error(f"Error streaming study plan: {str(e)}")
+            yield {'event': 'error', 'data': {'message': str(e)}}
+    
+    def _build_study_plan_prompt(self, semester, degree, subjects):
+        """Prompt for a semester study plan"""
+        return f"""Create a study plan for a {degree} student in semester {semester}.
 
 Subjects: {', '.join(subjects)}
 
@@ -408,15 +475,6 @@ Provide:
 5. Resource recommendations
 
 Keep it practical and actionable."""
-            
-            response = self.model.generate_content(prompt)
-            study_plan = response.text
-            
-            logging.info(f"Study plan generated for {degree} semester {semester}")
-            return {'success': True, 'study_plan': study_plan}
-        except Exception as e:
-            logging.error(f"Error generating study plan: {str(e)}")
-            return {'success': False, 'message': str(e)}
     
     def analyze_file_with_ai(self, file_id):
         """Analyze file content using AI (for text files)"""
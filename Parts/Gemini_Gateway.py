@@ -0,0 +1,338 @@
+"""
+Shared Gemini Gateway
+Features: One process-wide Gemini client, per-model concurrency limits, per-call timeouts,
+low-priority background calls
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+import google.generativeai as genai
+from Parts.Response_Cache import ResponseCache, CachedResponse, make_cache_key
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "gemini_gateway.log")
+
+# Defaults can be overridden from the environment
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '4'))
+DEFAULT_TIMEOUT = float(os.getenv('GEMINI_TIMEOUT', '60'))
+DEFAULT_QUEUE_TIMEOUT = float(os.getenv('GEMINI_QUEUE_TIMEOUT', '10'))
+COALESCE_ENABLED = os.getenv('GEMINI_COALESCE', '1') != '0'
+# Calls made inside gateway.background() (e.g. pre-generation) share this many slots per model
+DEFAULT_BACKGROUND_CONCURRENCY = int(os.getenv('GEMINI_BACKGROUND_CONCURRENCY', '1'))
+BACKGROUND_POLL_INTERVAL = 0.2
+
+
+class GatewayBusyError(RuntimeError):
+    """Raised when no upstream slot frees up within the queue timeout"""
+
+
+class _Flight:
+    """One in-flight upstream call that concurrent identical requests wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Merge concurrent calls with the same key into a single execution"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """Run fn once per key at a time; followers get the leader's result (or error)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.stats['leaders'] += 1
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+            if flight.waiters:
+                logger.info(f"Coalesced {flight.waiters} identical Gemini request(s)")
+
+    def get_stats(self):
+        """Get leader/merged counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._flights)
+        return stats
+
+
+class GatewayModel:
+    """Drop-in stand-in for genai.GenerativeModel that routes calls through the gateway"""
+
+    def __init__(self, gateway, model_name):
+        self.gateway = gateway
+        self.model_name = model_name
+
+    def generate_content(self, prompt, **kwargs):
+        """Same call shape as GenerativeModel.generate_content"""
+        return self.gateway.generate(self.model_name, prompt, **kwargs)
+
+    def stream_text(self, prompt, **kwargs):
+        """Yield response text chunks as the model produces them"""
+        return self.gateway.stream(self.model_name, prompt, **kwargs)
+
+
+class GeminiGateway:
+    def __init__(self, api_key=None, max_concurrency=None, timeout=None, queue_timeout=None):
+        """Initialize the gateway (use get_gateway() instead of building one directly)"""
+        self.api_key = None
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.queue_timeout = queue_timeout or DEFAULT_QUEUE_TIMEOUT
+        self.model_limits = {}
+        self._models = {}
+        self._semaphores = {}
+        self._background_semaphores = {}
+        # Foreground calls running or waiting per model; background calls start only at zero
+        self._foreground = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'errors': 0, 'rejected': 0, 'background_calls': 0}
+        self._cache = None
+        self.single_flight = SingleFlight()
+        if api_key:
+            self.configure(api_key)
+
+    def configure(self, api_key):
+        """Configure the shared client once; models built afterwards reuse its HTTP session"""
+        with self._lock:
+            if api_key == self.api_key:
+                return
+            genai.configure(api_key=api_key)
+            self.api_key = api_key
+            self._models = {}
+        logger.info("Gemini gateway configured")
+
+    def set_model_limit(self, model_name, max_concurrency):
+        """Override the concurrency limit for one model"""
+        with self._lock:
+            self.model_limits[model_name] = max_concurrency
+            self._semaphores[model_name] = threading.BoundedSemaphore(max_concurrency)
+
+    def limit_for(self, model_name):
+        """Concurrent upstream calls allowed for a model"""
+        with self._lock:
+            return self.model_limits.get(model_name, self.max_concurrency)
+
+    def model(self, model_name):
+        """Get a gateway-backed model handle"""
+        return GatewayModel(self, model_name)
+
+    def _get_model(self, model_name):
+        """Get (or build) the shared GenerativeModel for a model name"""
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def _get_semaphore(self, model_name):
+        """Get (or build) the concurrency semaphore for a model name"""
+        with self._lock:
+            if model_name not in self._semaphores:
+                limit = self.model_limits.get(model_name, self.max_concurrency)
+                self._semaphores[model_name] = threading.BoundedSemaphore(limit)
+            return self._semaphores[model_name]
+
+    @contextmanager
+    def background(self):
+        """Run the block's calls (in this thread) as low-priority background work"""
+        previous = getattr(self._local, 'background', False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+
+    def _busy(self, model_name):
+        """Count a call that got no slot and raise GatewayBusyError"""
+        with self._lock:
+            self.stats['rejected'] += 1
+        logger.warning(f"Gemini gateway busy: no slot for {model_name}")
+        raise GatewayBusyError('AI service is busy, please try again shortly')
+
+    def _acquire(self, model_name, queue_timeout=None):
+        """Wait for a free upstream slot or give up after the queue timeout; returns the release function"""
+        if getattr(self._local, 'background', False):
+            return self._acquire_background(model_name, queue_timeout)
+        semaphore = self._get_semaphore(model_name)
+        with self._lock:
+            self._foreground[model_name] = self._foreground.get(model_name, 0) + 1
+
+        def release():
+            semaphore.release()
+            with self._lock:
+                self._foreground[model_name] -= 1
+
+        if not semaphore.acquire(timeout=queue_timeout or self.queue_timeout):
+            with self._lock:
+                self._foreground[model_name] -= 1
+            self._busy(model_name)
+        return release
+
+    def _acquire_background(self, model_name, queue_timeout=None):
+        """Take a background slot, then a shared slot once no foreground call is running or waiting
+
+        Background work may wait up to the call timeout (or queue_timeout) before giving up.
+        """
+        deadline = time.monotonic() + (queue_timeout or self.timeout)
+        with self._lock:
+            if model_name not in self._background_semaphores:
+                limit = min(DEFAULT_BACKGROUND_CONCURRENCY, self.model_limits.get(model_name, self.max_concurrency))
+                self._background_semaphores[model_name] = threading.BoundedSemaphore(max(1, limit))
+            background = self._background_semaphores[model_name]
+        if not background.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._busy(model_name)
+
+        semaphore = self._get_semaphore(model_name)
+        while True:
+            with self._lock:
+                idle = not self._foreground.get(model_name)
+            if idle and semaphore.acquire(blocking=False):
+                break
+            if time.monotonic() >= deadline:
+                background.release()
+                self._busy(model_name)
+            time.sleep(BACKGROUND_POLL_INTERVAL)
+        with self._lock:
+            self.stats['background_calls'] += 1
+
+        def release():
+            semaphore.release()
+            background.release()
+
+        return release
+
+    @property
+    def cache(self):
+        """Disk response cache, opened on first use"""
+        with self._lock:
+            if self._cache is None:
+                self._cache = ResponseCache()
+            return self._cache
+
+    def generate(self, model_name, prompt, timeout=None, cache_ttl=None, queue_timeout=None, **kwargs):
+        """Call generate_content, serving deterministic prompts from cache when cache_ttl is set
+        and sharing one upstream call between concurrent identical prompts
+
+        queue_timeout overrides how long to wait for a free slot (callers that would
+        rather wait than fail, such as queued feedback work, pass a longer one)."""
+        if kwargs.get('stream'):
+            return self._generate_upstream(model_name, prompt, timeout, queue_timeout, **kwargs)
+
+        key = make_cache_key(model_name, prompt, kwargs.get('generation_config'))
+        if cache_ttl:
+            cached_text = self.cache.get(key)
+            if cached_text is not None:
+                return CachedResponse(cached_text)
+
+        def call():
+            response = self._generate_upstream(model_name, prompt, timeout, queue_timeout, **kwargs)
+            if cache_ttl:
+                self.cache.set(key, response.text, cache_ttl, model_name)
+            return response
+
+        if not COALESCE_ENABLED:
+            return call()
+        return self.single_flight.do(key, call)
+
+    def _generate_upstream(self, model_name, prompt, timeout=None, queue_timeout=None, **kwargs):
+        """Call generate_content with a bounded slot and a per-call timeout"""
+        request_options = dict(kwargs.pop('request_options', None) or {})
+        request_options.setdefault('timeout', timeout or self.timeout)
+
+        release = self._acquire(model_name, queue_timeout)
+        try:
+            response = self._get_model(model_name).generate_content(
+                prompt, request_options=request_options, **kwargs
+            )
+            with self._lock:
+                self.stats['calls'] += 1
+            return response
+        except Exception:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            release()
+
+    def stream(self, model_name, prompt, timeout=None, **kwargs):
+        """Yield text chunks from generate_content(stream=True), holding the slot until the stream ends"""
+        request_options = dict(kwargs.pop('request_options', None) or {})
+        request_options.setdefault('timeout', timeout or self.timeout)
+        kwargs.pop('stream', None)
+
+        release = self._acquire(model_name)
+        try:
+            response = self._get_model(model_name).generate_content(
+                prompt, stream=True, request_options=request_options, **kwargs
+            )
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. safety metadata only)
+                    continue
+                if text:
+                    yield text
+            with self._lock:
+                self.stats['calls'] += 1
+        except Exception:
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            release()
+
+    def get_stats(self):
+        """Get gateway and cache counters"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['cache'] = self.cache.get_stats()
+        stats['coalescing'] = self.single_flight.get_stats()
+        return stats
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway(api_key=None):
+    """Get the process-wide gateway, configuring it with api_key if given"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = GeminiGateway()
+    if api_key:
+        _gateway.configure(api_key)
+    return _gateway
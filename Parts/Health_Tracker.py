@@ -8,7 +8,8 @@ import logging
 import webbrowser
 import speech_recognition as sr
 from deep_translator import GoogleTranslator
-import google.generativeai as genai
+from Parts.Gemini_Gateway import get_gateway
+from Parts.Semantic_Cache import get_semantic_cache
 from datetime import datetime
 import json
 
@@ -20,11 +21,18 @@ logging.basicConfig(
 )
 # 
 class HealthTrackerAI:
+    # Cache lifetimes (seconds) for prompts built from a small, fixed set of inputs
+    CACHE_TTLS = {
+        'wellness_tips': 24 * 3600,
+        'first_aid': 7 * 24 * 3600
+    }
+
     def __init__(self, gemini_api_key):
         """Initialize Health Tracker with AI"""
         self.gemini_api_key = gemini_api_key
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.gateway = get_gateway(gemini_api_key)
+        self.model = self.gateway.model('gemini-2.5-pro')
+        self.semantic_cache = get_semantic_cache()
         self.translator = GoogleTranslator()
         self.recognizer = sr.Recognizer()
         self.health_history_file = 'health_history.json'
@@ -91,7 +99,7 @@ Tip [number]: [brief title]
 
 Focus on actionable, easy-to-implement advice."""
             
-            response = self.model.generate_content(prompt)
+            response = self.model.generate_content(prompt, cache_ttl=self.CACHE_TTLS['wellness_tips'])
             tips = response.text
             
             logging.info(f"Wellness tips generated for: {category}")
@@ -123,8 +131,12 @@ Include:
 
 Provide evidence-based, reliable information. Include disclaimer about consulting healthcare professionals."""
             
-            response = self.model.generate_content(prompt)
-            info = response.text
+            # Reuse the answer for a near-identical query if we have one
+            info = self.semantic_cache.lookup('medical_info', query)
+            if info is None:
+                response = self.model.generate_content(prompt)
+                info = response.text
+                self.semantic_cache.store('medical_info', query, info)
             
             # Generate search URLs
             webmd_url = f"https://www.webmd.com/search/search_results/default.aspx?query={query}"
@@ -177,7 +189,7 @@ CRITICAL: Start with "CALL EMERGENCY SERVICES IMMEDIATELY IF:" and list life-thr
 
 Keep instructions clear, numbered, and easy to follow in an emergency."""
             
-            response = self.model.generate_content(prompt)
+            response = self.model.generate_content(prompt, cache_ttl=self.CACHE_TTLS['first_aid'])
             guide = response.text
             
             logging.info(f"First aid guide generated: {emergency_type}")
@@ -200,8 +212,12 @@ Include:
 
 IMPORTANT: This is general educational information. Always follow your doctor's prescription and instructions. Never use this to self-medicate."""
             
-            response = self.model.generate_content(prompt)
-            info = response.text
+            # Reuse the answer for a near-identical query if we have one
+            info = self.semantic_cache.lookup('medication_info', medication_name)
+            if info is None:
+                response = self.model.generate_content(prompt)
+                info = response.text
+                self.semantic_cache.store('medication_info', medication_name, info)
             
             # Search URLs
             drugs_url = f"https://www.drugs.com/search.php?searchterm={medication_name}"
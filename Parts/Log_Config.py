@@ -0,0 +1,30 @@
+"""
+Module Loggers
+Features: File loggers for the shared helper modules, so importing a helper never decides
+where a feature module's own (root) logging goes
+"""
+
+import logging
+import threading
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_handlers = {}
+_lock = threading.Lock()
+
+
+def get_logger(name, filename):
+    """Logger `name` writing to `filename`; modules logging to the same file share one handler"""
+    logger = logging.getLogger(name)
+    with _lock:
+        if not logger.handlers:
+            handler = _handlers.get(filename)
+            if handler is None:
+                handler = logging.FileHandler(filename, encoding='utf-8', delay=True)
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                _handlers[filename] = handler
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            # Don't also hand records to whatever the root logger was configured with
+            logger.propagate = False
+    return logger
@@ -4,9 +4,21 @@ Features: Create, view, edit, delete, search notes with Gemini AI enhancement
 """
 
 import os
+import json
+import time
+import zlib
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import google.generativeai as genai
+from Parts.Gemini_Gateway import get_gateway
+from Parts.Notes_Catalog import get_topic_catalog
+from Parts.Notes_Search import get_search_index
+from Parts.Notes_Storage import get_note_store, format_note, note_bytes, topic_key, NOTE_LINE
+from Parts.Structured_Output import (
+    FLASHCARD_SCHEMA, JsonArrayStream, json_config, normalize_flashcard, parse_json_array, use_json_output
+)
 import speech_recognition as sr
 from pydub import AudioSegment
 
@@ -18,12 +30,36 @@ logging.basicConfig(
 )
 
 class NotesAI:
-    def __init__(self, gemini_api_key):
-        """Initialize with Gemini AI"""
+    # Map-reduce summarization settings (rough token estimate = characters / 4)
+    SUMMARY_CHUNK_MIN_TOKENS = int(os.getenv('NOTES_SUMMARY_CHUNK_MIN_TOKENS', '2000'))
+    SUMMARY_CHUNK_MAX_TOKENS = int(os.getenv('NOTES_SUMMARY_CHUNK_MAX_TOKENS', '6000'))
+    SUMMARY_CHUNK_CACHE_TTL = 30 * 24 * 3600
+    # Question answering sends at most this many notes, chosen by BM25 relevance
+    RETRIEVAL_TOP_K = int(os.getenv('NOTES_RETRIEVAL_TOP_K', '8'))
+    # Fuzzy single-topic search returns at most this many notes, best first
+    FUZZY_SEARCH_LIMIT = int(os.getenv('NOTES_FUZZY_SEARCH_LIMIT', '50'))
+    # Bulk import writes each topic in batches of this many notes
+    IMPORT_BATCH_SIZE = int(os.getenv('NOTES_IMPORT_BATCH_SIZE', '5000'))
+    EXPORT_PAGE_SIZE = 1000
+    # Topics not written for this many days are gzipped (0 disables); checked every interval seconds
+    COMPRESS_AFTER_DAYS = float(os.getenv('NOTES_COMPRESS_AFTER_DAYS', '30'))
+    COMPRESS_INTERVAL = float(os.getenv('NOTES_COMPRESS_INTERVAL', '3600'))
+    
+    def __init__(self, gemini_api_key, store=None):
+        """Initialize with Gemini AI and a notes storage backend"""
         self.gemini_api_key = gemini_api_key
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.store = store or get_note_store()
+        self.search_index = get_search_index()
+        self.catalog = get_topic_catalog()
+        self.gateway = get_gateway(gemini_api_key)
+        self.model = self.gateway.model('gemini-2.5-pro')
         self.recognizer = sr.Recognizer()
+        self.summary_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('NOTES_SUMMARY_WORKERS', '4')),
+            thread_name_prefix='notes-summary'
+        )
+        if self.COMPRESS_AFTER_DAYS > 0:
+            threading.Thread(target=self._cold_storage_loop, name='notes-cold-storage', daemon=True).start()
         
     def create_note(self, topic, note_text, use_ai=False):
         """Create a new note with optional AI enhancement"""
@@ -32,16 +68,16 @@ class NotesAI:
             if use_ai and note_text:
                 note_text = self.enhance_note_with_ai(topic, note_text)
             
-            filename = topic.replace(" ", "_") + "_notes.txt"
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            with open(filename, "a", encoding='utf-8') as file:
-                file.write(f"{timestamp} - {note_text}\n")
+            note_id = self.store.add_note(topic, note_text, timestamp)
+            self._update_search_index(topic, note_id, format_note(timestamp, note_text))
+            self._update_catalog(topic, 1, note_bytes(timestamp, note_text))
             
             logging.info(f"Note created for topic: {topic}")
             return {
                 'success': True,
                 'message': 'Note added successfully!' + (' (AI Enhanced)' if use_ai else ''),
+                'note_id': note_id,
                 'timestamp': timestamp,
                 'enhanced_note': note_text
             }
@@ -73,39 +109,41 @@ Return only the improved note without extra commentary."""
             logging.error(f"AI enhancement error: {str(e)}")
             return note_text  # Return original if AI fails
     
-    def view_notes(self, topic):
-        """View all notes for a topic"""
+    def view_notes(self, topic, limit=None, after_id=None, newest_first=False):
+        """View notes for a topic, optionally one page at a time
+        
+        With a limit, only that window is read from storage; pass the returned
+        next_cursor as after_id to get the following page.
+        """
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
-            
-            if not os.path.exists(filename):
-                return {'success': True, 'notes': []}
-            
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.readlines()
+            if not limit:
+                notes_list = self.store.list_notes(topic)
+                return {'success': True, 'notes': notes_list}
             
-            notes_list = [
-                {'id': idx, 'text': note.strip()} 
-                for idx, note in enumerate(notes, 1)
-            ]
+            notes_list, has_more = self.store.list_notes_page(topic, int(limit), after_id, newest_first)
+            next_cursor = notes_list[-1]['id'] if has_more and notes_list else None
             
-            return {'success': True, 'notes': notes_list}
+            return {
+                'success': True,
+                'notes': notes_list,
+                'has_more': has_more,
+                'next_cursor': next_cursor
+            }
         except Exception as e:
             logging.error(f"Error viewing notes: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def notes_version(self, topic):
+        """Cheap version of a topic's notes (changes on every write), for ETags"""
+        return self.store.fingerprint(topic)
+    
     def delete_note(self, topic, note_id):
         """Delete a specific note"""
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
-            
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.readlines()
-            
-            if 1 <= note_id <= len(notes):
-                notes.pop(note_id - 1)
-                with open(filename, "w", encoding='utf-8') as file:
-                    file.writelines(notes)
+            size = self.store.note_size(topic, note_id)
+            if self.store.delete_note(topic, note_id):
+                self._update_search_index(topic, note_id)
+                self._update_catalog(topic, -1, -size if size is not None else None)
                 logging.info(f"Note {note_id} deleted from topic: {topic}")
                 return {'success': True, 'message': 'Note deleted successfully!'}
             else:
@@ -117,20 +155,18 @@ Return only the improved note without extra commentary."""
     def edit_note(self, topic, note_id, new_text, use_ai=False):
         """Edit an existing note"""
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
-            
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.readlines()
-            
-            if 1 <= note_id <= len(notes):
+            if self.store.has_note(topic, note_id):
                 if use_ai:
                     new_text = self.enhance_note_with_ai(topic, new_text)
                 
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                notes[note_id - 1] = f"{timestamp} - {new_text}\n"
-                
-                with open(filename, "w", encoding='utf-8') as file:
-                    file.writelines(notes)
+                old_size = self.store.note_size(topic, note_id)
+                if not self.store.update_note(topic, note_id, new_text, timestamp):
+                    return {'success': False, 'message': 'Invalid note ID'}
+                self._update_search_index(topic, note_id, format_note(timestamp, new_text))
+                self._update_catalog(
+                    topic, 0, note_bytes(timestamp, new_text) - old_size if old_size is not None else None
+                )
                 
                 logging.info(f"Note {note_id} edited for topic: {topic}")
                 return {
@@ -144,60 +180,220 @@ Return only the improved note without extra commentary."""
             logging.error(f"Error editing note: {str(e)}")
             return {'success': False, 'message': str(e)}
     
-    def search_notes(self, topic, keyword):
-        """Search notes by keyword"""
+    def search_notes(self, topic, keyword, fuzzy=False):
+        """Search notes by keyword; fuzzy=True also finds misspelled words, best match first
+        
+        Fuzzy results stop at FUZZY_SEARCH_LIMIT notes; 'truncated' says whether more matched.
+        """
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
-            
-            if not os.path.exists(filename):
-                return {'success': True, 'notes': []}
-            
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.readlines()
-            
-            found_notes = [
-                {'id': idx, 'text': note.strip()}
-                for idx, note in enumerate(notes, 1)
-                if keyword.lower() in note.lower()
-            ]
-            
+            if fuzzy:
+                self.search_index.ensure_synced(self.store)
+                results = self.search_index.search(
+                    keyword, 'and', self.FUZZY_SEARCH_LIMIT + 1, topic_key(topic), fuzzy=True
+                )
+                truncated = len(results) > self.FUZZY_SEARCH_LIMIT
+                found_notes = [
+                    {'id': r['id'], 'text': r['text'], 'score': r['score']}
+                    for r in results[:self.FUZZY_SEARCH_LIMIT]
+                ]
+                return {'success': True, 'notes': found_notes, 'truncated': truncated}
+            
+            found_notes = self.store.search_notes(topic, keyword)
             return {'success': True, 'notes': found_notes}
         except Exception as e:
             logging.error(f"Error searching notes: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def search_all_notes(self, query, mode='and', limit=20, topic=None, fuzzy=False):
+        """Ranked search across every topic (mode 'and' needs all terms, 'or' any)"""
+        try:
+            started = time.time()
+            self.search_index.ensure_synced(self.store)
+            results = self.search_index.search(
+                query, mode, int(limit), topic_key(topic) if topic else None, bool(fuzzy)
+            )
+            
+            return {
+                'success': True,
+                'results': results,
+                'took_ms': round((time.time() - started) * 1000, 2)
+            }
+        except Exception as e:
+            logging.error(f"Error searching all notes: {str(e)}")
+            return {'success': False, 'message': str(e)}
+    
+    def import_notes(self, lines):
+        """Bulk import NDJSON lines ({"topic", "text", optional "timestamp"}), batched per topic
+        
+        lines can be any iterable (e.g. a request stream), so the upload is never held in
+        memory as a whole. Imported topics are reindexed for search lazily, on the next search.
+        """
+        imported = 0
+        errors = []
+        pending = {}
+        # topic -> [notes, bytes] written, for the catalog
+        touched = {}
+        valid_timestamps = set()
+        
+        def flush(topic):
+            batch = pending.pop(topic, [])
+            if batch:
+                self.store.add_notes(topic, batch)
+                totals = touched.setdefault(topic, [0, 0])
+                totals[0] += len(batch)
+                totals[1] += sum(note_bytes(timestamp, text) for text, timestamp in batch)
+            return len(batch)
+        
+        try:
+            for line_number, line in enumerate(lines, 1):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8')
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    topic = str(record['topic']).strip()
+                    text = str(record['text']).strip()
+                    if not topic or not text:
+                        raise ValueError('topic and text must not be empty')
+                except (ValueError, KeyError, TypeError) as e:
+                    if len(errors) < 20:
+                        errors.append({'line': line_number, 'message': str(e)})
+                    continue
+                
+                timestamp = str(record.get('timestamp') or '')
+                if timestamp not in valid_timestamps:
+                    try:
+                        datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+                        if len(valid_timestamps) < 10000:
+                            valid_timestamps.add(timestamp)
+                    except ValueError:
+                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                pending.setdefault(topic, []).append((text, timestamp))
+                if len(pending[topic]) >= self.IMPORT_BATCH_SIZE:
+                    imported += flush(topic)
+            
+            for topic in list(pending):
+                imported += flush(topic)
+        except Exception as e:
+            logging.error(f"Error importing notes: {str(e)}")
+            return {'success': False, 'message': str(e), 'imported': imported}
+        finally:
+            for topic, (count, size) in touched.items():
+                self.search_index.mark_stale(topic_key(topic))
+                self._update_catalog(topic, count, size)
+        
+        logging.info(f"Imported {imported} notes into {len(touched)} topic(s)")
+        return {'success': True, 'imported': imported, 'topics': len(touched), 'errors': errors}
+    
+    def export_notes(self, topic=None):
+        """Yield every note (or one topic's) as NDJSON lines, reading one page at a time"""
+        topics = [topic] if topic else self.store.list_topics()
+        for name in topics:
+            display_name = topic or name.replace("_", " ")
+            after_id = None
+            while True:
+                page, has_more = self.store.list_notes_page(name, self.EXPORT_PAGE_SIZE, after_id)
+                for note in page:
+                    match = NOTE_LINE.match(note['text'])
+                    record = {
+                        'topic': display_name,
+                        'id': note['id'],
+                        'timestamp': match.group(1) if match else None,
+                        'text': match.group(2) if match else note['text']
+                    }
+                    yield json.dumps(record, ensure_ascii=False) + "\n"
+                if not has_more or not page:
+                    break
+                after_id = page[-1]['id']
+    
+    def list_topics(self):
+        """Every topic with note count, size, last modified time and summary freshness"""
+        try:
+            self.catalog.ensure_synced(self.store)
+            return {'success': True, 'topics': self.catalog.list_topics()}
+        except Exception as e:
+            logging.error(f"Error listing topics: {str(e)}")
+            return {'success': False, 'message': str(e)}
+    
+    def compress_cold_topics(self):
+        """Gzip topics untouched for COMPRESS_AFTER_DAYS and mark them in the catalog"""
+        compressed = self.store.compress_cold_topics(self.COMPRESS_AFTER_DAYS * 24 * 3600)
+        for key in compressed:
+            self.catalog.record_compression(key, True, self.store.topic_stats(key).get('disk_bytes'))
+        if compressed:
+            logging.info(f"Compressed {len(compressed)} cold topic(s)")
+        return compressed
+    
+    def _cold_storage_loop(self):
+        """Background sweep for cold topics"""
+        while True:
+            time.sleep(self.COMPRESS_INTERVAL)
+            try:
+                self.compress_cold_topics()
+            except Exception as e:
+                logging.error(f"Error compressing cold topics: {str(e)}")
+    
+    def _update_catalog(self, topic, notes, size):
+        """Apply a write's change in note count and bytes to the catalog (failures are only logged)
+        
+        size=None means the change is unknown (the note vanished meanwhile): rescan the topic.
+        """
+        try:
+            if self.catalog.ensure_synced(self.store):
+                # The first sync of this process already counted the write
+                return
+            if size is None:
+                self.catalog.record_write(
+                    topic_key(topic), topic, self.store.topic_stats(topic), self.store.fingerprint(topic)
+                )
+            else:
+                self.catalog.record_delta(topic_key(topic), topic, notes, size, self.store.fingerprint(topic))
+        except Exception as e:
+            logging.warning(f"Topic catalog update failed for {topic}: {str(e)}")
+    
+    def _update_search_index(self, topic, note_id, text=None):
+        """Apply one write to the cross-topic search index (text=None means deleted)
+        
+        A failure here is logged, never surfaced: the next sync repairs the topic.
+        """
+        try:
+            # Index pre-existing notes first, or the recorded fingerprint would hide them
+            self.search_index.ensure_synced(self.store)
+            key = topic_key(topic)
+            fingerprint = self.store.fingerprint(topic)
+            if text is not None:
+                self.search_index.index_note(key, note_id, text, fingerprint)
+            elif self.store.stable_ids:
+                self.search_index.remove_note(key, note_id, fingerprint)
+            else:
+                # Line-numbered notes shift after a delete
+                self.search_index.reindex_topic(key, self.store.list_notes(topic), fingerprint)
+        except Exception as e:
+            logging.warning(f"Search index update failed for {topic}: {str(e)}")
+    
     def summarize_notes(self, topic):
         """Summarize all notes for a topic using AI"""
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
+            notes = self._load_topic_notes(topic)
             
-            if not os.path.exists(filename):
+            if notes is None:
                 return {'success': False, 'message': 'No notes found for this topic'}
             
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.read()
-            
-            if not notes.strip():
+            if not "".join(notes).strip():
                 return {'success': False, 'message': 'No notes to summarize'}
             
-            prompt = f"""Summarize these study notes for {topic}:
-
-{notes}
-
-Create a comprehensive summary that includes:
-1. Main topics covered
-2. Key concepts and definitions
-3. Important points to remember
-4. Quick review points
-5. Study tips based on the content
-
-Format it in a clear, organized way that's easy to review before exams."""
+            plan = self._plan_summary(topic, notes)
             
-            response = self.model.generate_content(prompt)
-            summary = response.text
+            if plan['mode'] == 'cached':
+                summary = plan['summary']
+            else:
+                response = self.model.generate_content(plan['prompt'])
+                summary = response.text
+                self._save_summary_state(topic, summary, plan['lines'])
             
-            logging.info(f"Notes summarized for topic: {topic}")
-            return {'success': True, 'summary': summary}
+            logging.info(f"Notes summarized for topic: {topic} ({plan['mode']}, {plan['chunks']} chunk(s))")
+            return {'success': True, 'summary': summary, 'mode': plan['mode'], 'chunks': plan['chunks']}
         except Exception as e:
             logging.error(f"Error summarizing notes: {str(e)}")
             return {'success': False, 'message': str(e)}
@@ -205,57 +401,322 @@ Format it in a clear, organized way that's easy to review before exams."""
     def ask_ai_about_notes(self, topic, question):
         """Ask AI questions about your notes"""
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
-            
-            if not os.path.exists(filename):
+            if not self.store.exists(topic):
                 return {'success': False, 'message': 'No notes found for this topic'}
             
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.read()
-            
-            prompt = f"""Based on these study notes for {topic}:
-
-{notes}
-
-Question: {question}
-
-Provide a clear, educational answer based on the notes. If the notes don't contain enough information, mention that and provide general knowledge about the topic."""
+            context, notes_used, total_notes = self._select_relevant_notes(topic, question)
+            prompt = self._build_question_prompt(topic, context, question)
             
             response = self.model.generate_content(prompt)
             answer = response.text
             
-            logging.info(f"AI answered question for topic: {topic}")
-            return {'success': True, 'answer': answer}
+            logging.info(f"AI answered question for topic: {topic} ({notes_used}/{total_notes} notes)")
+            return {'success': True, 'answer': answer, 'notes_used': notes_used, 'total_notes': total_notes}
         except Exception as e:
             logging.error(f"Error asking AI: {str(e)}")
             return {'success': False, 'message': str(e)}
     
-    def generate_flashcards(self, topic):
-        """Generate flashcards from notes using AI"""
+    def stream_summarize_notes(self, topic):
+        """Stream a summary of all notes for a topic as SSE-style events"""
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
+            notes = self._load_topic_notes(topic)
             
-            if not os.path.exists(filename):
-                return {'success': False, 'message': 'No notes found for this topic'}
+            if notes is None:
+                yield {'event': 'error', 'data': {'message': 'No notes found for this topic'}}
+                return
+            
+            if not "".join(notes).strip():
+                yield {'event': 'error', 'data': {'message': 'No notes to summarize'}}
+                return
+            
+            # Partial summaries are produced up front; only the final step streams
+            plan = self._plan_summary(topic, notes)
+            metadata = {'topic': topic, 'mode': plan['mode'], 'chunks': plan['chunks']}
+            
+            if plan['mode'] == 'cached':
+                yield {'event': 'chunk', 'data': {'text': plan['summary']}}
+                yield {'event': 'done', 'data': {**metadata, 'success': True, 'chars': len(plan['summary'])}}
+            else:
+                yield from self._stream_answer(
+                    plan['prompt'], metadata,
+                    on_complete=lambda summary: self._save_summary_state(topic, summary, plan['lines'])
+                )
+            
+            logging.info(f"Notes summary streamed for topic: {topic}")
+        except Exception as e:
+            logging.error(f"Error streaming summary: {str(e)}")
+            yield {'event': 'error', 'data': {'message': str(e)}}
+    
+    def stream_ask_ai_about_notes(self, topic, question):
+        """Stream an AI answer about your notes as SSE-style events"""
+        try:
+            if not self.store.exists(topic):
+                yield {'event': 'error', 'data': {'message': 'No notes found for this topic'}}
+                return
+            
+            context, notes_used, total_notes = self._select_relevant_notes(topic, question)
+            prompt = self._build_question_prompt(topic, context, question)
+            yield from self._stream_answer(prompt, {
+                'topic': topic,
+                'question': question,
+                'notes_used': notes_used,
+                'total_notes': total_notes
+            })
+            
+            logging.info(f"AI answer streamed for topic: {topic}")
+        except Exception as e:
+            logging.error(f"Error streaming AI answer: {str(e)}")
+            yield {'event': 'error', 'data': {'message': str(e)}}
+    
+    def _load_topic_notes(self, topic):
+        """All notes of a topic as prompt-ready lines, or None if the topic has no notes"""
+        if not self.store.exists(topic):
+            return None
+        return [note['text'] + "\n" for note in self.store.list_notes(topic)]
+    
+    def _select_relevant_notes(self, topic, question):
+        """Pick the top-k notes for a question so prompt size stays bounded
+        
+        Returns (notes text for the prompt, number of notes used, notes in the topic).
+        Candidates come from the cross-topic search index, so the topic is never loaded
+        as a whole. Notes keep their original order; if nothing matches, the most recent
+        notes are used instead.
+        """
+        recent, has_more = self.store.list_notes_page(topic, self.RETRIEVAL_TOP_K, newest_first=True)
+        selected = recent[::-1]
+        if not has_more:
+            return "".join(note['text'] + "\n" for note in selected), len(selected), len(selected)
+        
+        self.search_index.ensure_synced(self.store)
+        key = topic_key(topic)
+        ranked = self.search_index.search(question, 'or', self.RETRIEVAL_TOP_K, key)
+        if ranked:
+            selected = sorted(ranked, key=lambda note: note['id'])
+        total_notes = self.search_index.note_count(key)
+        
+        return "".join(note['text'] + "\n" for note in selected), len(selected), total_notes
+    
+    def _stream_answer(self, prompt, metadata, on_complete=None):
+        """Forward model chunks as 'chunk' events and finish with a 'done' event"""
+        started = time.time()
+        first_chunk_at = None
+        parts = []
+        
+        for text in self.model.stream_text(prompt):
+            if first_chunk_at is None:
+                first_chunk_at = time.time()
+            parts.append(text)
+            yield {'event': 'chunk', 'data': {'text': text}}
+        
+        chars = sum(len(part) for part in parts)
+        if on_complete:
+            on_complete("".join(parts))
+        
+        yield {'event': 'done', 'data': {
+            **metadata,
+            'success': True,
+            'chars': chars,
+            'first_chunk_ms': round((first_chunk_at - started) * 1000) if first_chunk_at else None,
+            'total_ms': round((time.time() - started) * 1000)
+        }}
+    
+    def _plan_summary(self, topic, lines):
+        """Decide how to produce a summary: reuse the stored one, fold in new notes, or rebuild
+        
+        The stored summary records how many notes it covers (the high-water mark) and a
+        hash of those notes. If the covered notes are unchanged, only notes appended since
+        are folded in; any edit or delete before the mark changes the hash and forces a rebuild.
+        """
+        state = self._load_summary_state(topic)
+        
+        if state and state['covered_count'] <= len(lines) and \
+                state['covered_hash'] == self._hash_lines(lines[:state['covered_count']]):
+            new_text = "".join(lines[state['covered_count']:])
+            if not new_text.strip():
+                return {'mode': 'cached', 'summary': state['summary'], 'lines': lines, 'chunks': 0}
+            if self._estimate_tokens(new_text) <= self.SUMMARY_CHUNK_MAX_TOKENS:
+                prompt = self._build_update_prompt(topic, state['summary'], new_text)
+                return {'mode': 'incremental', 'prompt': prompt, 'lines': lines, 'chunks': 1}
+        
+        prompt, chunk_count = self._prepare_summary_prompt(topic, "".join(lines))
+        return {'mode': 'rebuild', 'prompt': prompt, 'lines': lines, 'chunks': chunk_count}
+    
+    def _summary_file(self, topic):
+        """Sidecar file holding the rolling summary for a topic"""
+        return self.store.sidecar_path(topic, "_summary.json")
+    
+    def _hash_lines(self, lines):
+        """Hash a list of note lines"""
+        digest = hashlib.sha256()
+        for line in lines:
+            digest.update(line.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _load_summary_state(self, topic):
+        """Load the stored rolling summary for a topic, if any"""
+        try:
+            with open(self._summary_file(topic), "r", encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+    
+    def _save_summary_state(self, topic, summary, lines):
+        """Store a summary together with the high-water mark of the notes it covers"""
+        try:
+            state = {
+                'summary': summary,
+                'covered_count': len(lines),
+                'covered_hash': self._hash_lines(lines),
+                'updated_at': datetime.now().isoformat()
+            }
+            with open(self._summary_file(topic), "w", encoding='utf-8') as file:
+                json.dump(state, file, ensure_ascii=False)
+            self.catalog.ensure_synced(self.store)
+            self.catalog.record_summary(topic_key(topic), self.store.fingerprint(topic))
+        except Exception as e:
+            logging.error(f"Error saving summary state: {str(e)}")
+    
+    def _build_update_prompt(self, topic, summary, new_notes):
+        """Prompt for folding newly added notes into an existing summary"""
+        return f"""Here is the current summary of a student's study notes for {topic}:
+
+{summary}
+
+These notes were added since the summary was written:
+
+{new_notes}
+
+Update this summary so it also covers the new notes. Keep the same structure (main topics, key concepts and definitions, important points, quick review points, study tips), keep everything that is still relevant, and return only the updated summary."""
+    
+    def _prepare_summary_prompt(self, topic, notes):
+        """Get the final summary prompt, map-reducing notes that don't fit in one chunk"""
+        chunks = self._split_into_chunks(notes.splitlines(keepends=True))
+        if len(chunks) <= 1:
+            return self._build_summary_prompt(topic, notes), 1
+        
+        # Map: summarize chunks concurrently; unchanged chunks are served from the response cache
+        partials = list(self.summary_executor.map(
+            lambda chunk: self._summarize_chunk(topic, chunk), chunks
+        ))
+        
+        # Reduce again if the partial summaries themselves are too large
+        combined = "\n\n".join(partials)
+        while self._estimate_tokens(combined) > self.SUMMARY_CHUNK_MAX_TOKENS and len(partials) > 1:
+            groups = self._split_into_chunks([p + "\n\n" for p in partials])
+            if len(groups) >= len(partials):
+                break
+            partials = list(self.summary_executor.map(
+                lambda group: self._summarize_chunk(topic, group), groups
+            ))
+            combined = "\n\n".join(partials)
+        
+        return self._build_reduce_prompt(topic, partials), len(chunks)
+    
+    def _split_into_chunks(self, lines):
+        """Split note lines into token-bounded chunks with content-defined boundaries
+        
+        A chunk may end after a line whose hash hits a fixed pattern once it holds
+        SUMMARY_CHUNK_MIN_TOKENS, and must end at SUMMARY_CHUNK_MAX_TOKENS. Boundaries
+        depend on nearby content only, so appending or editing a note changes the
+        chunk that holds it and leaves the others (and their cached summaries) alone.
+        """
+        chunks = []
+        current = []
+        current_tokens = 0
+        
+        for line in lines:
+            line_tokens = self._estimate_tokens(line)
+            if current and current_tokens + line_tokens > self.SUMMARY_CHUNK_MAX_TOKENS:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
             
-            with open(filename, "r", encoding='utf-8') as file:
-                notes = file.read()
+            current.append(line)
+            current_tokens += line_tokens
             
-            prompt = f"""Based on these notes for {topic}, create 10 flashcards:
+            if current_tokens >= self.SUMMARY_CHUNK_MIN_TOKENS and zlib.crc32(line.encode('utf-8')) % 4 == 0:
+                chunks.append("".join(current))
+                current, current_tokens = [], 0
+        
+        if current:
+            chunks.append("".join(current))
+        return chunks
+    
+    def _estimate_tokens(self, text):
+        """Rough token count for budgeting prompts"""
+        return len(text) // 4 + 1
+    
+    def _summarize_chunk(self, topic, chunk):
+        """Summarize one chunk of notes (cached by chunk content)"""
+        prompt = f"""Summarize this section of study notes for {topic}:
+
+{chunk}
+
+List the main topics, key concepts and definitions, and important points from this section.
+Be concise and keep every fact that matters for exam review."""
+        
+        response = self.model.generate_content(prompt, cache_ttl=self.SUMMARY_CHUNK_CACHE_TTL)
+        return response.text
+    
+    def _build_reduce_prompt(self, topic, partials):
+        """Prompt for merging partial summaries into the final summary"""
+        sections = "\n\n".join(
+            f"Section {i} summary:\n{partial}" for i, partial in enumerate(partials, 1)
+        )
+        return f"""These are summaries of consecutive sections of study notes for {topic}:
+
+{sections}
+
+Combine them into one comprehensive summary that includes:
+1. Main topics covered
+2. Key concepts and definitions
+3. Important points to remember
+4. Quick review points
+5. Study tips based on the content
+
+Format it in a clear, organized way that's easy to review before exams."""
+    
+    def _build_summary_prompt(self, topic, notes):
+        """Prompt for summarizing a topic's notes"""
+        return f"""Summarize these study notes for {topic}:
 
 {notes}
 
-Format each flashcard as:
-FRONT: [question or term]
-BACK: [answer or definition]
+Create a comprehensive summary that includes:
+1. Main topics covered
+2. Key concepts and definitions
+3. Important points to remember
+4. Quick review points
+5. Study tips based on the content
 
-Focus on key concepts, definitions, and important facts."""
+Format it in a clear, organized way that's easy to review before exams."""
+    
+    def _build_question_prompt(self, topic, notes, question):
+        """Prompt for answering a question from a topic's notes"""
+        return f"""Based on these study notes for {topic}:
+
+{notes}
+
+Question: {question}
+
+Provide a clear, educational answer based on the notes. If the notes don't contain enough information, mention that and provide general knowledge about the topic."""
+    
+    def generate_flashcards(self, topic):
+        """Generate flashcards from notes using AI"""
+        try:
+            notes = self._load_topic_notes(topic)
             
-            response = self.model.generate_content(prompt)
-            flashcards_text = response.text
+            if notes is None:
+                return {'success': False, 'message': 'No notes found for this topic'}
+            
+            prompt = self._build_flashcards_prompt(topic, "".join(notes))
             
-            # Parse flashcards
-            flashcards = self._parse_flashcards(flashcards_text)
+            if use_json_output():
+                response = self.model.generate_content(prompt, generation_config=json_config(FLASHCARD_SCHEMA))
+                items = parse_json_array(response.text)
+                flashcards = [card for card in map(normalize_flashcard, items) if card]
+            else:
+                response = self.model.generate_content(prompt)
+                flashcards = self._parse_flashcards(response.text)
             
             logging.info(f"Flashcards generated for topic: {topic}")
             return {'success': True, 'flashcards': flashcards}
@@ -263,6 +724,75 @@ Focus on key concepts, definitions, and important facts."""
             logging.error(f"Error generating flashcards: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def stream_flashcards(self, topic):
+        """Stream flashcards from notes as SSE-style events, one 'flashcard' event per card"""
+        try:
+            notes = self._load_topic_notes(topic)
+            
+            if notes is None:
+                yield {'event': 'error', 'data': {'message': 'No notes found for this topic'}}
+                return
+            
+            started = time.time()
+            first_card_at = None
+            count = 0
+            prompt = self._build_flashcards_prompt(topic, "".join(notes))
+            
+            for card in self._stream_flashcard_items(prompt):
+                if first_card_at is None:
+                    first_card_at = time.time()
+                yield {'event': 'flashcard', 'data': {'index': count, 'flashcard': card}}
+                count += 1
+            
+            logging.info(f"Flashcards streamed for topic: {topic}")
+            yield {'event': 'done', 'data': {
+                'success': True,
+                'topic': topic,
+                'count': count,
+                'first_card_ms': round((first_card_at - started) * 1000) if first_card_at else None,
+                'total_ms': round((time.time() - started) * 1000)
+            }}
+        except Exception as e:
+            logging.error(f"Error streaming flashcards: {str(e)}")
+            yield {'event': 'error', 'data': {'message': str(e)}}
+    
+    def _build_flashcards_prompt(self, topic, notes):
+        """Prompt for 10 flashcards, in the configured output format"""
+        if use_json_output():
+            card_format = "Return a JSON array with one object per flashcard: front (question or term) and back (answer or definition)."
+        else:
+            card_format = """Format each flashcard as:
+FRONT: [question or term]
+BACK: [answer or definition]"""
+        return f"""Based on these notes for {topic}, create 10 flashcards:
+
+{notes}
+
+{card_format}
+
+Focus on key concepts, definitions, and important facts."""
+    
+    def _stream_flashcard_items(self, prompt):
+        """Yield each flashcard as soon as the streamed reply contains all of it"""
+        if use_json_output():
+            parser = JsonArrayStream()
+            for text in self.model.stream_text(prompt, generation_config=json_config(FLASHCARD_SCHEMA)):
+                for item in parser.feed(text):
+                    card = normalize_flashcard(item)
+                    if card:
+                        yield card
+            return
+        
+        # Text format: a card is complete once the next FRONT: line starts
+        pending = ""
+        for text in self.model.stream_text(prompt):
+            pending += text
+            cut = pending.rfind('\nFRONT:')
+            if cut > 0:
+                yield from self._parse_flashcards(pending[:cut])
+                pending = pending[cut:]
+        yield from self._parse_flashcards(pending)
+    
     def _parse_flashcards(self, text):
         """Parse flashcards from AI response"""
         flashcards = []
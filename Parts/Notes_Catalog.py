@@ -0,0 +1,200 @@
+"""
+Notes Topic Catalog
+Features: One row per topic (note count, size, last modified, summary freshness, compression)
+kept current on every write, so listing topics never touches the notes themselves
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "notes_ai.log")
+
+DEFAULT_CATALOG_FILE = os.getenv('NOTES_CATALOG_DB', 'notes_catalog.db')
+
+
+class TopicCatalog:
+    """SQLite table of per-topic metadata
+
+    A topic's summary is fresh when the store fingerprint recorded with the last saved
+    summary still matches the fingerprint recorded with the last write.
+    """
+
+    def __init__(self, catalog_file=None):
+        """Open (or create) the catalog database"""
+        self.catalog_file = catalog_file or DEFAULT_CATALOG_FILE
+        self._lock = threading.Lock()
+        self._synced = False
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS topics (
+                    topic TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    note_count INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    last_modified TEXT,
+                    fingerprint TEXT,
+                    summary_fingerprint TEXT,
+                    summary_updated TEXT,
+                    compressed INTEGER NOT NULL DEFAULT 0,
+                    disk_bytes INTEGER
+                )
+            """)
+            # Catalogs created before compression was tracked lack the last two columns
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(topics)")}
+            if 'compressed' not in columns:
+                conn.execute("ALTER TABLE topics ADD COLUMN compressed INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE topics ADD COLUMN disk_bytes INTEGER")
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success"""
+        conn = sqlite3.connect(self.catalog_file, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record_write(self, key, name, stats, fingerprint, last_modified=None):
+        """Refresh a topic's row after its notes changed"""
+        last_modified = last_modified or datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO topics (topic, name, note_count, bytes, last_modified, fingerprint, "
+                "compressed, disk_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(topic) DO UPDATE SET name = excluded.name, note_count = excluded.note_count, "
+                "bytes = excluded.bytes, last_modified = excluded.last_modified, "
+                "fingerprint = excluded.fingerprint, compressed = excluded.compressed, "
+                "disk_bytes = excluded.disk_bytes",
+                (key, name, stats['note_count'], stats['bytes'], last_modified, fingerprint,
+                 int(stats.get('compressed', False)), stats.get('disk_bytes', stats['bytes']))
+            )
+
+    def record_delta(self, key, name, notes, size, fingerprint, last_modified=None):
+        """Apply one write's change in note count and bytes without rescanning the topic
+
+        A write decompresses a gzipped topic, so its on-disk size becomes the plain size.
+        Backends with extra on-disk data (the log store's offset index and dead records) get
+        an exact disk_bytes again on the next sync or compression.
+        """
+        last_modified = last_modified or datetime.now().isoformat(timespec='seconds')
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO topics (topic, name, note_count, bytes, last_modified, fingerprint, "
+                "compressed, disk_bytes) VALUES (?, ?, ?, ?, ?, ?, 0, ?) "
+                "ON CONFLICT(topic) DO UPDATE SET name = excluded.name, note_count = MAX(note_count + ?, 0), "
+                "disk_bytes = MAX(CASE WHEN compressed THEN bytes ELSE COALESCE(disk_bytes, bytes) END + ?, 0), "
+                "bytes = MAX(bytes + ?, 0), last_modified = excluded.last_modified, "
+                "fingerprint = excluded.fingerprint, compressed = 0",
+                (key, name, max(notes, 0), max(size, 0), last_modified, fingerprint, max(size, 0),
+                 notes, size, size)
+            )
+
+    def record_compression(self, key, compressed, disk_bytes):
+        """Note that a topic was compressed (or expanded) without its notes changing"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE topics SET compressed = ?, disk_bytes = ? WHERE topic = ?",
+                (int(compressed), disk_bytes, key)
+            )
+
+    def record_summary(self, key, fingerprint):
+        """Remember which version of a topic the saved summary covers"""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE topics SET summary_fingerprint = ?, summary_updated = ? WHERE topic = ?",
+                (fingerprint, datetime.now().isoformat(timespec='seconds'), key)
+            )
+
+    def remove(self, key):
+        """Forget a topic"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM topics WHERE topic = ?", (key,))
+
+    def sync(self, store):
+        """Add or refresh topics whose store fingerprint no longer matches the catalog"""
+        topics = set(store.list_topics())
+        with self._connect() as conn:
+            known = {row[0]: (row[1], bool(row[2])) for row in conn.execute(
+                "SELECT topic, fingerprint, compressed FROM topics"
+            )}
+
+        refreshed = 0
+        for key in topics:
+            fingerprint = store.fingerprint(key)
+            compressed = store.is_compressed(key)
+            if key in known and known[key] == (fingerprint, compressed):
+                continue
+            stats = store.topic_stats(key)
+            refreshed += 1
+            if key in known and known[key][0] == fingerprint:
+                # Only compressed or expanded since the last sync
+                self.record_compression(key, compressed, stats.get('disk_bytes'))
+                continue
+            last_modified = None
+            path = getattr(store, 'notes_file', None)
+            if path:
+                candidates = [path(key), path(key) + ".gz"]
+                existing = [candidate for candidate in candidates if os.path.exists(candidate)]
+                if existing:
+                    mtime = os.path.getmtime(existing[0])
+                    last_modified = datetime.fromtimestamp(mtime).isoformat(timespec='seconds')
+            self.record_write(key, key.replace("_", " "), stats, fingerprint, last_modified)
+        for key in set(known) - topics:
+            self.remove(key)
+        self._synced = True
+        if refreshed:
+            logger.info(f"Topic catalog refreshed {refreshed} topic(s)")
+        return refreshed
+
+    def ensure_synced(self, store):
+        """Sync once per process; afterwards writes keep the catalog current
+
+        Returns True if this call ran the sync.
+        """
+        if self._synced:
+            return False
+        self.sync(store)
+        return True
+
+    def list_topics(self):
+        """Every topic with its metadata, most recently modified first"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT topic, name, note_count, bytes, last_modified, fingerprint, "
+                "summary_fingerprint, summary_updated, compressed, disk_bytes FROM topics "
+                "ORDER BY last_modified DESC, topic"
+            ).fetchall()
+        return [
+            {
+                'topic': row[0],
+                'name': row[1],
+                'note_count': row[2],
+                'bytes': row[3],
+                'last_modified': row[4],
+                'summary_fresh': row[6] is not None and row[6] == row[5],
+                'summary_updated': row[7],
+                'compressed': bool(row[8]),
+                'disk_bytes': row[9]
+            }
+            for row in rows
+        ]
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_topic_catalog():
+    """Get the process-wide topic catalog"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = TopicCatalog()
+        return _catalog
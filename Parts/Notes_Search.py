@@ -0,0 +1,517 @@
+"""
+Cross-Topic Notes Search
+Features: Persistent SQLite inverted index over every note in every topic, kept up to date on
+each write, BM25-ranked AND/OR queries, typo-tolerant matching through a trigram index
+"""
+
+import os
+import re
+import math
+import sqlite3
+import threading
+from contextlib import contextmanager
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "notes_ai.log")
+
+DEFAULT_INDEX_FILE = os.getenv('NOTES_SEARCH_DB', 'notes_search.db')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'do', 'does', 'for', 'from',
+    'how', 'i', 'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to',
+    'was', 'what', 'when', 'where', 'which', 'who', 'why', 'with', 'you', 'can'
+}
+
+# Notes start with "YYYY-MM-DD HH:MM:SS - "; the timestamp shouldn't count as content
+TIMESTAMP_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} - ')
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords or the note timestamp"""
+    text = TIMESTAMP_PREFIX.sub('', text)
+    return [t for t in re.findall(r'[a-z0-9]+', text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def _term_counts(text):
+    """Term frequencies and token count for one note"""
+    counts = {}
+    tokens = tokenize(text)
+    for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+    return counts, len(tokens)
+
+
+def trigrams(term):
+    """Character trigrams of a term, padded so short words still have some"""
+    padded = f"#{term}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, max_distance):
+    """Levenshtein distance, giving up (returning max_distance + 1) once it must exceed max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class NoteSearchIndex:
+    """Inverted index: postings(term, doc, tf) plus per-term document frequencies
+
+    Each note is one document keyed by (topic, note_id). Every posting also stores the
+    document length and an impact score (the BM25 term weight without idf) so that a
+    term's best postings can be read first from an index. Terms with more postings
+    than CHAMPIONS only contribute their top-impact postings as candidates; the
+    candidates are then scored exactly. Very common terms therefore cost the same as
+    rare ones, at the price of possibly missing low-impact matches of those terms.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    CHAMPIONS = int(os.getenv('NOTES_SEARCH_CHAMPIONS', '1000'))
+    # Fuzzy matching: trigram candidates checked per word, and close terms kept per word
+    FUZZY_CANDIDATES = 200
+    FUZZY_EXPANSIONS = 5
+
+    def __init__(self, index_file=None):
+        """Open (or create) the index database"""
+        self.index_file = index_file or DEFAULT_INDEX_FILE
+        self._lock = threading.Lock()
+        self._synced = False
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    doc_id INTEGER PRIMARY KEY,
+                    topic TEXT NOT NULL,
+                    note_id INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    UNIQUE(topic, note_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    doc_id INTEGER NOT NULL,
+                    tf INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    impact REAL NOT NULL,
+                    PRIMARY KEY (term, doc_id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_impact ON postings(term, impact DESC)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS terms (
+                    term TEXT PRIMARY KEY,
+                    df INTEGER NOT NULL
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS trigrams (
+                    trigram TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    PRIMARY KEY (trigram, term)
+                ) WITHOUT ROWID
+            """)
+            # generation counts mark_stale calls; indexed_generation is the last one a rebuild covered
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS topics (
+                    topic TEXT PRIMARY KEY,
+                    fingerprint TEXT,
+                    generation INTEGER NOT NULL DEFAULT 0,
+                    indexed_generation INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(topics)")}
+            for column in ('generation', 'indexed_generation'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE topics ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO stats VALUES ('doc_count', 0), ('total_length', 0)")
+            # Indexes built before fuzzy search existed have terms but no trigrams
+            if conn.execute("SELECT 1 FROM trigrams LIMIT 1").fetchone() is None:
+                self._add_trigrams(conn, [row[0] for row in conn.execute("SELECT term FROM terms")])
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success"""
+        conn = sqlite3.connect(self.index_file, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _add_trigrams(self, conn, terms):
+        """Register vocabulary terms in the trigram table"""
+        conn.executemany(
+            "INSERT OR IGNORE INTO trigrams VALUES (?, ?)",
+            [(gram, term) for term in terms for gram in trigrams(term)]
+        )
+
+    def _drop_unused_terms(self, conn, terms):
+        """Remove those of the just-decremented terms no document uses any more, with their trigrams"""
+        terms = list(terms)
+        unused = []
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            unused.extend(row[0] for row in conn.execute(
+                f"SELECT term FROM terms WHERE term IN ({', '.join('?' for _ in batch)}) AND df <= 0", batch
+            ))
+        if unused:
+            conn.executemany(
+                "DELETE FROM trigrams WHERE trigram = ? AND term = ?",
+                [(gram, term) for term in unused for gram in trigrams(term)]
+            )
+            conn.executemany("DELETE FROM terms WHERE term = ?", [(term,) for term in unused])
+
+    def _weight(self, tf, length, avg_length):
+        """BM25 term weight without the idf factor"""
+        return tf * (self.K1 + 1) / (tf + self.K1 * (1 - self.B + self.B * length / (avg_length or 1)))
+
+    def _avg_length(self, conn):
+        """Document count and average document length"""
+        stats = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+        doc_count = stats.get('doc_count', 0)
+        return doc_count, (stats.get('total_length', 0) / doc_count) if doc_count else 0.0
+
+    def _add_docs(self, conn, topic, notes):
+        """Insert notes ([{'id', 'text'}]) and their postings in one batch"""
+        if not notes:
+            return
+        parsed = [(note, _term_counts(note['text'])) for note in notes]
+        doc_count, avg_length = self._avg_length(conn)
+        batch_length = sum(length for _, (_, length) in parsed)
+        avg_length = (avg_length * doc_count + batch_length) / (doc_count + len(parsed))
+
+        postings = []
+        df = {}
+        for note, (counts, length) in parsed:
+            doc_id = conn.execute(
+                "INSERT INTO docs (topic, note_id, text, length) VALUES (?, ?, ?, ?)",
+                (topic, note['id'], note['text'], length)
+            ).lastrowid
+            for term, tf in counts.items():
+                postings.append((term, doc_id, tf, length, self._weight(tf, length, avg_length)))
+                df[term] = df.get(term, 0) + 1
+
+        conn.executemany("INSERT INTO postings VALUES (?, ?, ?, ?, ?)", postings)
+        conn.executemany(
+            "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+            list(df.items())
+        )
+        self._add_trigrams(conn, df)
+        conn.execute("UPDATE stats SET value = value + ? WHERE key = 'doc_count'", (len(parsed),))
+        conn.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (batch_length,))
+
+    def _remove_doc(self, conn, topic, note_id):
+        """Delete one note and its postings; returns False if it wasn't indexed"""
+        row = conn.execute(
+            "SELECT doc_id, text, length FROM docs WHERE topic = ? AND note_id = ?", (topic, note_id)
+        ).fetchone()
+        if row is None:
+            return False
+        doc_id, text, length = row
+        terms = [(term,) for term in _term_counts(text)[0]]
+        conn.executemany(f"DELETE FROM postings WHERE term = ? AND doc_id = {doc_id}", terms)
+        conn.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+        self._drop_unused_terms(conn, [term for term, in terms])
+        conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+        conn.execute("UPDATE stats SET value = value - 1 WHERE key = 'doc_count'")
+        conn.execute("UPDATE stats SET value = value - ? WHERE key = 'total_length'", (length,))
+        return True
+
+    def _clear_topic(self, conn, topic):
+        """Delete every note of a topic and its postings in one pass"""
+        rows = conn.execute("SELECT doc_id, text, length FROM docs WHERE topic = ?", (topic,)).fetchall()
+        if not rows:
+            return
+        postings = []
+        df = {}
+        for doc_id, text, _ in rows:
+            for term in _term_counts(text)[0]:
+                postings.append((term, doc_id))
+                df[term] = df.get(term, 0) + 1
+        conn.executemany("DELETE FROM postings WHERE term = ? AND doc_id = ?", postings)
+        conn.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(n, t) for t, n in df.items()])
+        self._drop_unused_terms(conn, df)
+        conn.execute("DELETE FROM docs WHERE topic = ?", (topic,))
+        conn.execute("UPDATE stats SET value = value - ? WHERE key = 'doc_count'", (len(rows),))
+        conn.execute(
+            "UPDATE stats SET value = value - ? WHERE key = 'total_length'", (sum(row[2] for row in rows),)
+        )
+
+    def _set_fingerprint(self, conn, topic, fingerprint):
+        """Remember which version of a topic the index reflects (a pending stale mark is kept)"""
+        conn.execute(
+            "INSERT INTO topics (topic, fingerprint) VALUES (?, ?) "
+            "ON CONFLICT(topic) DO UPDATE SET fingerprint = excluded.fingerprint",
+            (topic, fingerprint)
+        )
+
+    def index_note(self, topic, note_id, text, fingerprint=None):
+        """Add or replace one note"""
+        with self._lock, self._connect() as conn:
+            self._remove_doc(conn, topic, note_id)
+            self._add_docs(conn, topic, [{'id': note_id, 'text': text}])
+            self._set_fingerprint(conn, topic, fingerprint)
+
+    def remove_note(self, topic, note_id, fingerprint=None):
+        """Drop one note"""
+        with self._lock, self._connect() as conn:
+            self._remove_doc(conn, topic, note_id)
+            self._set_fingerprint(conn, topic, fingerprint)
+
+    def reindex_topic(self, topic, notes, fingerprint=None, generation=None):
+        """Replace everything indexed for a topic with notes ([{'id', 'text'}])
+
+        generation is the topic's stale generation read before the notes were loaded;
+        the rebuild clears stale marks up to it, never a newer one.
+        """
+        with self._lock, self._connect() as conn:
+            self._clear_topic(conn, topic)
+            self._add_docs(conn, topic, notes)
+            self._set_fingerprint(conn, topic, fingerprint)
+            if generation is not None:
+                conn.execute(
+                    "UPDATE topics SET indexed_generation = MAX(indexed_generation, ?) WHERE topic = ?",
+                    (generation, topic)
+                )
+        logger.info(f"Search index rebuilt for topic {topic}: {len(notes)} notes")
+
+    def drop_topic(self, topic):
+        """Forget a topic entirely"""
+        with self._lock, self._connect() as conn:
+            self._clear_topic(conn, topic)
+            conn.execute("DELETE FROM topics WHERE topic = ?", (topic,))
+
+    def sync(self, store):
+        """Bring the index in line with a note store, rebuilding only topics whose fingerprint changed"""
+        topics = set(store.list_topics())
+        with self._connect() as conn:
+            indexed = {
+                topic: (fingerprint, generation, generation > indexed_generation)
+                for topic, fingerprint, generation, indexed_generation in conn.execute(
+                    "SELECT topic, fingerprint, generation, indexed_generation FROM topics"
+                )
+            }
+
+        rebuilt = 0
+        for topic in topics:
+            fingerprint = store.fingerprint(topic)
+            indexed_fingerprint, generation, stale = indexed.get(topic, (None, 0, True))
+            if stale or indexed_fingerprint != fingerprint:
+                self.reindex_topic(topic, store.list_notes(topic), fingerprint, generation)
+                rebuilt += 1
+        for topic in set(indexed) - topics:
+            self.drop_topic(topic)
+        self._synced = True
+        return rebuilt
+
+    def mark_stale(self, topic):
+        """Have the next search rebuild a topic, e.g. after a bulk import bypassed the write hooks
+
+        The mark is a generation bump that only a full rebuild clears, so single-note
+        writes from other processes can't hide it.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO topics (topic, fingerprint, generation) VALUES (?, NULL, 1) "
+                "ON CONFLICT(topic) DO UPDATE SET fingerprint = NULL, generation = generation + 1",
+                (topic,)
+            )
+            self._synced = False
+
+    def ensure_synced(self, store):
+        """Sync once per process; afterwards rebuild only topics marked stale (by any process)"""
+        if not self._synced:
+            self.sync(store)
+            return
+        with self._connect() as conn:
+            stale = conn.execute(
+                "SELECT topic, generation FROM topics WHERE generation > indexed_generation"
+            ).fetchall()
+        for topic, generation in stale:
+            fingerprint = store.fingerprint(topic)
+            self.reindex_topic(topic, store.list_notes(topic), fingerprint, generation)
+
+    def note_count(self, topic):
+        """Number of indexed notes in a topic"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM docs WHERE topic = ?", (topic,)).fetchone()[0]
+
+    def _postings(self, conn, term, df, doc_ids=None, topic=None):
+        """{doc_id: (tf, length)} for a term: its champions, only the given documents, or all of a topic's"""
+        if doc_ids is not None:
+            rows = []
+            doc_ids = list(doc_ids)
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                rows += conn.execute(
+                    f"SELECT doc_id, tf, length FROM postings WHERE term = ? "
+                    f"AND doc_id IN ({', '.join('?' for _ in batch)})",
+                    [term] + batch
+                ).fetchall()
+        elif topic is not None:
+            # Champions are global; cutting them first could leave nothing for a small topic
+            rows = conn.execute(
+                "SELECT postings.doc_id, tf, postings.length FROM postings "
+                "JOIN docs ON docs.doc_id = postings.doc_id WHERE term = ? AND docs.topic = ?",
+                (term, topic)
+            ).fetchall()
+        elif df > self.CHAMPIONS:
+            rows = conn.execute(
+                "SELECT doc_id, tf, length FROM postings INDEXED BY idx_postings_impact "
+                "WHERE term = ? ORDER BY impact DESC LIMIT ?",
+                (term, self.CHAMPIONS)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT doc_id, tf, length FROM postings WHERE term = ?", (term,)
+            ).fetchall()
+        return {doc_id: (tf, length) for doc_id, tf, length in rows}
+
+    def search(self, query, mode='and', limit=20, topic=None, fuzzy=False):
+        """Ranked notes matching all (mode='and') or any (mode='or') query terms
+
+        With fuzzy=True each query word also matches indexed words within a small edit
+        distance, weighted by how close they are. With a topic, candidates are read from
+        that topic's postings only. Returns [{'topic', 'id', 'text', 'score'}], best first.
+        """
+        words = sorted(set(tokenize(query)))
+        if not words:
+            return []
+        require_all = str(mode).lower() != 'or'
+
+        with self._connect() as conn:
+            doc_count, avg_length = self._avg_length(conn)
+            if not doc_count:
+                return []
+
+            # One group of alternative terms per query word: {term: similarity}
+            if fuzzy:
+                groups = [self._fuzzy_terms(conn, word) for word in words]
+            else:
+                groups = [{word: 1.0} for word in words]
+            all_terms = sorted(set().union(*groups))
+            df = dict(conn.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({', '.join('?' for _ in all_terms)})", all_terms
+            ).fetchall()) if all_terms else {}
+            groups = [{t: w for t, w in group.items() if t in df} for group in groups]
+            if require_all and not all(groups):
+                return []
+            groups = [group for group in groups if group]
+            if not groups:
+                return []
+            idf = {
+                term: math.log(1 + (doc_count - freq + 0.5) / (freq + 0.5)) for term, freq in df.items()
+            }
+
+            # Candidates: rarest group's postings for AND, every term's champions for OR
+            groups.sort(key=lambda group: sum(df[t] for t in group))
+            matched = {}
+            if require_all:
+                candidates = set()
+                for term in groups[0]:
+                    matched[term] = self._postings(conn, term, df[term], topic=topic)
+                    candidates.update(matched[term])
+                for group in groups[1:]:
+                    found = set()
+                    for term in group:
+                        matched[term] = self._postings(conn, term, df[term], candidates)
+                        found.update(matched[term])
+                    candidates &= found
+            else:
+                for group in groups:
+                    for term in group:
+                        matched[term] = self._postings(conn, term, df[term], topic=topic)
+                candidates = set().union(*matched.values())
+                for term in list(matched):
+                    missing = [d for d in candidates if d not in matched[term]]
+                    if missing and topic is None and df[term] > self.CHAMPIONS:
+                        matched[term].update(self._postings(conn, term, df[term], missing))
+
+            # A word scores through its best-matching alternative
+            scores = {}
+            for doc_id in candidates:
+                score = 0.0
+                for group in groups:
+                    best = 0.0
+                    for term, similarity in group.items():
+                        posting = matched[term].get(doc_id)
+                        if posting:
+                            best = max(best, similarity * idf[term] * self._weight(posting[0], posting[1], avg_length))
+                    score += best
+                scores[doc_id] = score
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:int(limit)]
+            if not best:
+                return []
+            docs = conn.execute(
+                f"SELECT doc_id, topic, note_id, text FROM docs WHERE doc_id IN ({', '.join('?' for _ in best)})",
+                [doc_id for doc_id, _ in best]
+            ).fetchall()
+
+        by_id = {row[0]: row for row in docs}
+        return [
+            {'topic': by_id[doc_id][1], 'id': by_id[doc_id][2], 'text': by_id[doc_id][3], 'score': round(score, 4)}
+            for doc_id, score in best if doc_id in by_id
+        ]
+
+    def _fuzzy_terms(self, conn, word):
+        """Indexed terms close to word as {term: similarity}
+
+        Candidates come from the trigram table: a term within edit distance d of the
+        word shares at least len(trigrams) - 3 * d trigrams with it. Only those are
+        checked with a real (bounded) edit distance.
+        """
+        max_distance = 1 if len(word) <= 4 else 2
+        grams = sorted(trigrams(word))
+        min_shared = max(1, len(grams) - 3 * max_distance)
+        rows = conn.execute(
+            f"SELECT term, COUNT(*) AS shared FROM trigrams WHERE trigram IN ({', '.join('?' for _ in grams)}) "
+            f"GROUP BY term HAVING shared >= ? ORDER BY shared DESC LIMIT ?",
+            grams + [min_shared, self.FUZZY_CANDIDATES]
+        ).fetchall()
+
+        matches = {}
+        for term, _ in rows:
+            distance = edit_distance(word, term, max_distance)
+            if distance <= max_distance:
+                matches[term] = 1.0 - distance / max(len(word), len(term))
+        best = sorted(matches.items(), key=lambda item: item[1], reverse=True)[:self.FUZZY_EXPANSIONS]
+        return dict(best)
+
+    def get_stats(self):
+        """Document, term and topic counts"""
+        with self._connect() as conn:
+            stats = dict(conn.execute("SELECT key, value FROM stats").fetchall())
+            stats['terms'] = conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+            stats['topics'] = conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
+        return stats
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """Get the process-wide notes search index"""
+    global _search_index
+    with _search_index_lock:
+        if _search_index is None:
+            _search_index = NoteSearchIndex()
+        return _search_index
@@ -0,0 +1,1086 @@
+"""
+Notes Storage Backends
+Features: Plain-text topic files, an append-only log with an offset index, or a SQLite (WAL)
+note store with stable IDs, one-time migration
+"""
+
+import os
+import re
+import glob
+import gzip
+import mmap
+import shutil
+import bisect
+import time
+import struct
+import sqlite3
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from Parts.Log_Config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of one process
+    fcntl = None
+
+logger = get_logger(__name__, "notes_ai.log")
+
+# Stored note lines look like "YYYY-MM-DD HH:MM:SS - note text"
+NOTE_LINE = re.compile(r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - (.*)$', re.DOTALL)
+
+
+def topic_key(topic):
+    """Normalize a topic name the same way the notes files always have"""
+    return topic.replace(" ", "_")
+
+
+def format_note(timestamp, text):
+    """Render a note the way it has always been shown"""
+    return f"{timestamp} - {text}"
+
+
+def note_bytes(timestamp, text):
+    """Size of a note as a stored line, the unit topic_stats counts in"""
+    return len(f"{format_note(timestamp, text)}\n".encode('utf-8'))
+
+
+class _TopicLocks:
+    """Per-topic writer locks shared by threads and, through flock, by worker processes
+
+    Each topic gets a thread RLock plus an exclusive advisory lock on <topic>_notes.lock
+    taken by the outermost holder, so nested use from one thread never self-deadlocks.
+    Without fcntl (Windows) only the thread lock applies.
+    """
+
+    def __init__(self, lock_path):
+        self._lock_path = lock_path
+        self._locks = {}
+        self._depth = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, topic):
+        """Hold the topic's lock for the duration of the block"""
+        key = topic_key(topic)
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.RLock()
+            rlock = self._locks[key]
+
+        with rlock:
+            depth = self._depth.get(key, 0)
+            handle = None
+            if depth == 0 and fcntl is not None:
+                handle = open(self._lock_path(topic), "a")
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            self._depth[key] = depth + 1
+            try:
+                yield
+            finally:
+                self._depth[key] = depth
+                if handle is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                    handle.close()
+
+
+def _replace_file(path, lines):
+    """Write lines to a temp file and swap it in, so readers never see a half-written file"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding='utf-8') as file:
+        file.writelines(lines)
+    os.replace(tmp_path, path)
+
+
+def _topics_from_files(base_dir):
+    """Topic keys of the <topic>_notes.txt(.gz) files in a directory"""
+    topics = set()
+    for suffix in ("_notes.txt", "_notes.txt.gz"):
+        topics.update(
+            os.path.basename(path)[:-len(suffix)]
+            for path in glob.glob(os.path.join(base_dir, "*" + suffix))
+        )
+    return sorted(topics)
+
+
+# Cold topics: <topic>_notes.txt is swapped for <topic>_notes.txt.gz until the next write
+COMPRESSED_SUFFIX = ".gz"
+
+
+def _open_notes(path, binary=False):
+    """Open a notes file for reading, streaming through gzip if the topic is compressed"""
+    try:
+        return open(path, "rb") if binary else open(path, "r", encoding='utf-8')
+    except FileNotFoundError:
+        compressed = path + COMPRESSED_SUFFIX
+        if not os.path.exists(compressed):
+            raise
+        return gzip.open(compressed, "rb") if binary else gzip.open(compressed, "rt", encoding='utf-8')
+
+
+def _gzip_original_size(path):
+    """Uncompressed size recorded in a gzip trailer (exact below 4 GiB)"""
+    with open(path, "rb") as file:
+        file.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', file.read(4))[0]
+
+
+def _compress_file(path):
+    """Replace path with path.gz, keeping its modification time"""
+    stat = os.stat(path)
+    compressed = path + COMPRESSED_SUFFIX
+    tmp_path = f"{compressed}.{os.getpid()}.tmp"
+    with open(path, "rb") as source, gzip.open(tmp_path, "wb") as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp_path, compressed)
+    os.remove(path)
+
+
+def _decompress_file(path):
+    """Bring back path from path.gz (if compressed), keeping its modification time"""
+    compressed = path + COMPRESSED_SUFFIX
+    if os.path.exists(path) or not os.path.exists(compressed):
+        return False
+    stat = os.stat(compressed)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(compressed, "rb") as source, open(tmp_path, "wb") as target:
+        shutil.copyfileobj(source, target, 1 << 20)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp_path, path)
+    os.remove(compressed)
+    logger.info(f"Decompressed {compressed} for writing")
+    return True
+
+
+class TextNoteStore:
+    """One <topic>_notes.txt file per topic, one note per line; IDs are line numbers"""
+
+    name = 'text'
+    stable_ids = False
+
+    def __init__(self, base_dir='.'):
+        self.base_dir = base_dir
+        self._locks = _TopicLocks(lambda topic: self.sidecar_path(topic, ".lock"))
+
+    def notes_file(self, topic):
+        """Path of the notes file for a topic"""
+        return os.path.join(self.base_dir, topic_key(topic) + "_notes.txt")
+
+    def sidecar_path(self, topic, suffix):
+        """Path for derived data (indexes, caches) kept next to a topic's notes"""
+        return os.path.join(self.base_dir, topic_key(topic) + "_notes" + suffix)
+
+    def list_topics(self):
+        """Keys of every topic that has a notes file"""
+        return _topics_from_files(self.base_dir)
+
+    def exists(self, topic):
+        """Whether any notes were ever written for a topic"""
+        return os.path.exists(self.notes_file(topic)) or self.is_compressed(topic)
+
+    def is_compressed(self, topic):
+        """Whether the topic is currently stored gzipped"""
+        return os.path.exists(self.notes_file(topic) + COMPRESSED_SUFFIX)
+
+    def fingerprint(self, topic):
+        """Cheap change detector (size + modification time), or None if no notes
+
+        Compression keeps the original size and mtime, so it doesn't change the fingerprint.
+        """
+        try:
+            stat = os.stat(self.notes_file(topic))
+            return f"{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:
+            pass
+        compressed = self.notes_file(topic) + COMPRESSED_SUFFIX
+        try:
+            stat = os.stat(compressed)
+            return f"{_gzip_original_size(compressed)}:{stat.st_mtime_ns}"
+        except OSError:
+            return None
+
+    def add_note(self, topic, text, timestamp):
+        """Append a note and return its ID"""
+        with self._locks.hold(topic):
+            _decompress_file(self.notes_file(topic))
+            with open(self.notes_file(topic), "a", encoding='utf-8') as file:
+                file.write(f"{format_note(timestamp, text)}\n")
+            return self._scan_lines(topic)[0]
+
+    def add_notes(self, topic, notes):
+        """Append many (text, timestamp) notes in one write; returns their IDs"""
+        with self._locks.hold(topic):
+            _decompress_file(self.notes_file(topic))
+            first_id = self._scan_lines(topic)[0] + 1
+            with open(self.notes_file(topic), "a", encoding='utf-8') as file:
+                file.write("".join(f"{format_note(timestamp, text)}\n" for text, timestamp in notes))
+            return list(range(first_id, first_id + len(notes)))
+
+    def list_notes(self, topic):
+        """All notes for a topic as [{'id', 'text'}]"""
+        return [
+            {'id': idx, 'text': note.strip()}
+            for idx, note in enumerate(self._read_lines(topic), 1)
+        ]
+
+    def list_notes_page(self, topic, limit, after_id=None, newest_first=False):
+        """One page of notes after a cursor; returns (notes, has_more)
+
+        Lines are streamed so memory stays bounded by the page size, but plain files
+        have no index, so finding the window still scans up to it.
+        """
+        if not self.exists(topic):
+            return [], False
+
+        with _open_notes(self.notes_file(topic)) as file:
+            if newest_first:
+                # Keep only the last limit + 1 lines before the cursor
+                window = deque(maxlen=limit + 1)
+                for idx, line in enumerate(file, 1):
+                    if after_id is not None and idx >= after_id:
+                        break
+                    window.append({'id': idx, 'text': line.strip()})
+                page = list(reversed(window))
+            else:
+                page = []
+                for idx, line in enumerate(file, 1):
+                    if after_id is not None and idx <= after_id:
+                        continue
+                    page.append({'id': idx, 'text': line.strip()})
+                    if len(page) > limit:
+                        break
+
+        return page[:limit], len(page) > limit
+
+    def has_note(self, topic, note_id):
+        """Whether a note ID exists in a topic"""
+        return 1 <= note_id <= self._scan_lines(topic)[0]
+
+    def update_note(self, topic, note_id, text, timestamp):
+        """Replace a note's text; returns False if the ID doesn't exist"""
+        with self._locks.hold(topic):
+            _decompress_file(self.notes_file(topic))
+            notes = self._read_lines(topic)
+            if not 1 <= note_id <= len(notes):
+                return False
+            notes[note_id - 1] = f"{format_note(timestamp, text)}\n"
+            _replace_file(self.notes_file(topic), notes)
+            return True
+
+    def delete_note(self, topic, note_id):
+        """Delete a note; returns False if the ID doesn't exist"""
+        with self._locks.hold(topic):
+            _decompress_file(self.notes_file(topic))
+            notes = self._read_lines(topic)
+            if not 1 <= note_id <= len(notes):
+                return False
+            notes.pop(note_id - 1)
+            _replace_file(self.notes_file(topic), notes)
+            return True
+
+    def search_notes(self, topic, keyword):
+        """Case-insensitive substring search within a topic"""
+        keyword = keyword.lower()
+        return [note for note in self.list_notes(topic) if keyword in note['text'].lower()]
+
+    def note_size(self, topic, note_id):
+        """Bytes one note takes in topic_stats, or None if the ID doesn't exist"""
+        notes = self._read_lines(topic)
+        if not 1 <= note_id <= len(notes):
+            return None
+        return len(notes[note_id - 1].encode('utf-8'))
+
+    def topic_stats(self, topic):
+        """Note count, size in bytes and on-disk size, counting lines without decoding them"""
+        if not self.exists(topic):
+            return {'note_count': 0, 'bytes': 0, 'disk_bytes': 0, 'compressed': False}
+        compressed = self.is_compressed(topic)
+        count, size = self._scan_lines(topic)
+        disk_path = self.notes_file(topic) + (COMPRESSED_SUFFIX if compressed else "")
+        return {'note_count': count, 'bytes': size, 'disk_bytes': os.path.getsize(disk_path), 'compressed': compressed}
+
+    def compress_topic(self, topic):
+        """Gzip a topic's notes file; the next write decompresses it again"""
+        with self._locks.hold(topic):
+            if not os.path.exists(self.notes_file(topic)):
+                return False
+            _compress_file(self.notes_file(topic))
+            logger.info(f"Compressed cold topic {topic}")
+            return True
+
+    def compress_cold_topics(self, max_age):
+        """Compress every topic not written for max_age seconds; returns their keys"""
+        cutoff = time.time() - max_age
+        compressed = []
+        for key in self.list_topics():
+            try:
+                if os.path.getmtime(self.notes_file(key)) < cutoff and self.compress_topic(key):
+                    compressed.append(key)
+            except OSError:
+                continue
+        return compressed
+
+    def _scan_lines(self, topic):
+        """(line count, size in bytes) of a topic file, counting newlines without decoding"""
+        if not self.exists(topic):
+            return 0, 0
+        count = 0
+        size = 0
+        last = b"\n"
+        with _open_notes(self.notes_file(topic), binary=True) as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                count += block.count(b"\n")
+                size += len(block)
+                last = block[-1:]
+        if last != b"\n":
+            count += 1
+        return count, size
+
+    def _read_lines(self, topic):
+        """Raw lines of a topic file ([] if missing)"""
+        if not self.exists(topic):
+            return []
+        with _open_notes(self.notes_file(topic)) as file:
+            return file.readlines()
+
+
+class SQLiteNoteStore:
+    """All topics in one SQLite database (WAL mode); note IDs never change"""
+
+    name = 'sqlite'
+    stable_ids = True
+
+    def __init__(self, db_file='notes.db', base_dir='.'):
+        self.base_dir = base_dir
+        self.db_file = os.path.join(base_dir, db_file)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS notes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    text TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_topic_id ON notes(topic, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS topic_versions (
+                    topic TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+            # One marker row per imported text file, written in the same transaction as its notes
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS migrations (
+                    source TEXT PRIMARY KEY,
+                    notes INTEGER NOT NULL,
+                    migrated TEXT NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success"""
+        conn = sqlite3.connect(self.db_file, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _bump_version(self, conn, key):
+        """Record a write to a topic"""
+        conn.execute(
+            "INSERT INTO topic_versions VALUES (?, 1) "
+            "ON CONFLICT(topic) DO UPDATE SET version = version + 1",
+            (key,)
+        )
+
+    def sidecar_path(self, topic, suffix):
+        """Path for derived data (indexes, caches) kept next to the database"""
+        return os.path.join(self.base_dir, topic_key(topic) + "_notes" + suffix)
+
+    def list_topics(self):
+        """Keys of every topic that was ever written"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT topic FROM topic_versions ORDER BY topic").fetchall()
+        return [row[0] for row in rows]
+
+    def exists(self, topic):
+        """Whether any notes were ever written for a topic"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM topic_versions WHERE topic = ?", (topic_key(topic),)
+            ).fetchone()
+        return row is not None
+
+    def fingerprint(self, topic):
+        """Cheap change detector (write counter), or None if no notes"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT version FROM topic_versions WHERE topic = ?", (topic_key(topic),)
+            ).fetchone()
+        return f"v{row[0]}" if row else None
+
+    def add_note(self, topic, text, timestamp):
+        """Insert a note and return its ID"""
+        key = topic_key(topic)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO notes (topic, timestamp, text) VALUES (?, ?, ?)",
+                (key, timestamp, text)
+            )
+            self._bump_version(conn, key)
+            return cursor.lastrowid
+
+    def add_notes(self, topic, notes):
+        """Insert many (text, timestamp) notes in one transaction; returns their IDs"""
+        key = topic_key(topic)
+        with self._connect() as conn:
+            note_ids = [
+                conn.execute(
+                    "INSERT INTO notes (topic, timestamp, text) VALUES (?, ?, ?)", (key, timestamp, text)
+                ).lastrowid
+                for text, timestamp in notes
+            ]
+            self._bump_version(conn, key)
+        return note_ids
+
+    def list_notes(self, topic):
+        """All notes for a topic as [{'id', 'text'}]"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, timestamp, text FROM notes WHERE topic = ? ORDER BY id",
+                (topic_key(topic),)
+            ).fetchall()
+        return [{'id': row[0], 'text': format_note(row[1], row[2])} for row in rows]
+
+    def list_notes_page(self, topic, limit, after_id=None, newest_first=False):
+        """One page of notes after a cursor; returns (notes, has_more)"""
+        if newest_first:
+            condition, order = "id < ?", "DESC"
+            cursor = after_id if after_id is not None else 2 ** 63 - 1
+        else:
+            condition, order = "id > ?", "ASC"
+            cursor = after_id if after_id is not None else 0
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, timestamp, text FROM notes WHERE topic = ? AND {condition} "
+                f"ORDER BY id {order} LIMIT ?",
+                (topic_key(topic), cursor, limit + 1)
+            ).fetchall()
+        page = [{'id': row[0], 'text': format_note(row[1], row[2])} for row in rows]
+        return page[:limit], len(page) > limit
+
+    def has_note(self, topic, note_id):
+        """Whether a note ID exists in a topic"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM notes WHERE topic = ? AND id = ?", (topic_key(topic), note_id)
+            ).fetchone()
+        return row is not None
+
+    def update_note(self, topic, note_id, text, timestamp):
+        """Replace a note's text; returns False if the ID doesn't exist"""
+        key = topic_key(topic)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE notes SET timestamp = ?, text = ? WHERE topic = ? AND id = ?",
+                (timestamp, text, key, note_id)
+            )
+            if cursor.rowcount:
+                self._bump_version(conn, key)
+            return cursor.rowcount > 0
+
+    def delete_note(self, topic, note_id):
+        """Delete a note; returns False if the ID doesn't exist"""
+        key = topic_key(topic)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM notes WHERE topic = ? AND id = ?", (key, note_id)
+            )
+            if cursor.rowcount:
+                self._bump_version(conn, key)
+            return cursor.rowcount > 0
+
+    def search_notes(self, topic, keyword):
+        """Case-insensitive substring search within a topic"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, timestamp, text FROM notes "
+                "WHERE topic = ? AND instr(lower(timestamp || ' - ' || text), ?) > 0 ORDER BY id",
+                (topic_key(topic), keyword.lower())
+            ).fetchall()
+        return [{'id': row[0], 'text': format_note(row[1], row[2])} for row in rows]
+
+    def note_size(self, topic, note_id):
+        """Bytes one note takes in topic_stats, or None if the ID doesn't exist"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT length(CAST(timestamp || ' - ' || text AS BLOB)) + 1 FROM notes WHERE topic = ? AND id = ?",
+                (topic_key(topic), note_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def topic_stats(self, topic):
+        """Note count and size in bytes (as the notes would be written out as text)"""
+        with self._connect() as conn:
+            count, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length(CAST(timestamp || ' - ' || text AS BLOB)) + 1), 0) "
+                "FROM notes WHERE topic = ?",
+                (topic_key(topic),)
+            ).fetchone()
+        return {'note_count': count, 'bytes': size, 'disk_bytes': size, 'compressed': False}
+
+    def is_compressed(self, topic):
+        """SQLite topics are never compressed individually"""
+        return False
+
+    def compress_cold_topics(self, max_age):
+        """Nothing to do: every topic lives in the one database file"""
+        return []
+
+    def import_text_file(self, topic, path):
+        """Copy every line of a <topic>_notes.txt file into the store; returns the count
+
+        The file (name, size and modification time) is recorded in the migrations table in
+        the same transaction, so a file that was already imported returns None instead.
+        """
+        key = topic_key(topic)
+        stat = os.stat(path)
+        source = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        rows = []
+        with open(path, "r", encoding='utf-8') as file:
+            for line in file:
+                line = line.rstrip('\n')
+                if not line.strip():
+                    continue
+                match = NOTE_LINE.match(line)
+                if match:
+                    rows.append((key, match.group(1), match.group(2)))
+                else:
+                    rows.append((key, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), line))
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                return None
+            conn.executemany("INSERT INTO notes (topic, timestamp, text) VALUES (?, ?, ?)", rows)
+            self._bump_version(conn, key)
+            conn.execute(
+                "INSERT INTO migrations VALUES (?, ?, ?)",
+                (source, len(rows), datetime.now().isoformat(timespec='seconds'))
+            )
+        return len(rows)
+
+
+class _LogIndex:
+    """In-memory view of a topic's offset index, refreshed from the sidecar's new tail"""
+
+    def __init__(self):
+        self.inode = None
+        self.parsed_bytes = 0
+        self.live = {}
+        self.total_records = 0
+        self.next_id = 1
+
+
+class LogNoteStore:
+    """Append-only <topic>_notes.txt plus a <topic>_notes.idx offset index
+
+    The notes file stays plain text. Every write appends to it and adds a fixed-size
+    record (note_id, flags, offset, length) to the index; an edit appends the new
+    version and a delete appends a tombstone, so nothing is rewritten in place. Reads
+    map the notes file into memory and slice out exactly the notes they need. A
+    background compactor rewrites a topic once the share of dead records passes
+    NOTES_COMPACT_THRESHOLD. IDs are stable.
+    """
+
+    name = 'log'
+    stable_ids = True
+
+    RECORD = struct.Struct('<IIQQ')
+    LIVE = 0
+    TOMBSTONE = 1
+
+    def __init__(self, base_dir='.', compact_threshold=None, compact_interval=None):
+        self.base_dir = base_dir
+        self.compact_threshold = compact_threshold or float(os.getenv('NOTES_COMPACT_THRESHOLD', '0.3'))
+        self.compact_interval = compact_interval or float(os.getenv('NOTES_COMPACT_INTERVAL', '60'))
+        self.compact_min_records = 64
+        self._indexes = {}
+        self._locks = _TopicLocks(lambda topic: self.sidecar_path(topic, ".lock"))
+        self._lock = threading.Lock()
+        self._dirty_topics = set()
+        self._compactor = None
+
+    def notes_file(self, topic):
+        """Path of the plain-text notes file for a topic"""
+        return os.path.join(self.base_dir, topic_key(topic) + "_notes.txt")
+
+    def index_file(self, topic):
+        """Path of the offset index for a topic"""
+        return os.path.join(self.base_dir, topic_key(topic) + "_notes.idx")
+
+    def sidecar_path(self, topic, suffix):
+        """Path for derived data (indexes, caches) kept next to a topic's notes"""
+        return os.path.join(self.base_dir, topic_key(topic) + "_notes" + suffix)
+
+    def list_topics(self):
+        """Keys of every topic that has a notes file"""
+        return _topics_from_files(self.base_dir)
+
+    def _topic_lock(self, topic):
+        """Lock serializing access to one topic across threads and worker processes
+
+        Readers take it too: the compactor swaps both files, and a reader in another
+        process must not pair the new notes file with the old index.
+        """
+        return self._locks.hold(topic)
+
+    def exists(self, topic):
+        """Whether any notes were ever written for a topic"""
+        return (os.path.exists(self.index_file(topic)) or os.path.exists(self.notes_file(topic))
+                or self.is_compressed(topic))
+
+    def is_compressed(self, topic):
+        """Whether the topic's notes file is currently stored gzipped"""
+        return os.path.exists(self.notes_file(topic) + COMPRESSED_SUFFIX)
+
+    def fingerprint(self, topic):
+        """Cheap change detector (index inode + size), or None if no notes"""
+        try:
+            stat = os.stat(self.index_file(topic))
+        except OSError:
+            return None if not self.exists(topic) else "unindexed"
+        return f"{stat.st_ino}:{stat.st_size}"
+
+    def _index(self, topic):
+        """Up-to-date index for a topic, parsing only records appended since the last call"""
+        key = topic_key(topic)
+        index_path = self.index_file(topic)
+
+        with self._topic_lock(topic):
+            if not os.path.exists(index_path) and os.path.exists(self.notes_file(topic)):
+                self._build_index_from_text(topic)
+
+            cached = self._indexes.get(key) or _LogIndex()
+            try:
+                stat = os.stat(index_path)
+            except OSError:
+                self._indexes[key] = _LogIndex()
+                return self._indexes[key]
+
+            # The compactor swapped in a new file: start over
+            if cached.inode != stat.st_ino or stat.st_size < cached.parsed_bytes:
+                cached = _LogIndex()
+                cached.inode = stat.st_ino
+
+            if stat.st_size > cached.parsed_bytes:
+                with open(index_path, "rb") as file:
+                    file.seek(cached.parsed_bytes)
+                    tail = file.read(stat.st_size - cached.parsed_bytes)
+                usable = len(tail) - len(tail) % self.RECORD.size
+                for note_id, flags, offset, length in self.RECORD.iter_unpack(tail[:usable]):
+                    if flags == self.TOMBSTONE:
+                        cached.live.pop(note_id, None)
+                    else:
+                        cached.live[note_id] = (offset, length)
+                    cached.next_id = max(cached.next_id, note_id + 1)
+                cached.total_records += usable // self.RECORD.size
+                cached.parsed_bytes += usable
+
+            self._indexes[key] = cached
+            return cached
+
+    def _build_index_from_text(self, topic):
+        """Index an existing plain-text notes file, one note per line"""
+        records = []
+        offset = 0
+        with open(self.notes_file(topic), "rb") as file:
+            for note_id, line in enumerate(file, 1):
+                records.append(self.RECORD.pack(note_id, self.LIVE, offset, len(line)))
+                offset += len(line)
+        with open(self.index_file(topic), "wb") as file:
+            file.write(b"".join(records))
+        logger.info(f"Built offset index for {self.notes_file(topic)}: {len(records)} notes")
+
+    def _append(self, topic, note_id, flags, data=b""):
+        """Append note bytes (if any) and one index record"""
+        offset = 0
+        if data:
+            _decompress_file(self.notes_file(topic))
+            with open(self.notes_file(topic), "ab") as file:
+                offset = file.seek(0, os.SEEK_END)
+                file.write(data)
+        with open(self.index_file(topic), "ab") as file:
+            file.write(self.RECORD.pack(note_id, flags, offset, len(data)))
+        self._mark_dirty(topic)
+
+    def _read_notes(self, topic, note_ids):
+        """Read the given note IDs straight out of the memory-mapped notes file"""
+        index = self._index(topic)
+        if not note_ids:
+            return []
+        if not os.path.exists(self.notes_file(topic)) and self.is_compressed(topic):
+            return self._read_compressed_notes(topic, index, note_ids)
+        with open(self.notes_file(topic), "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                notes = []
+                for note_id in note_ids:
+                    offset, length = index.live[note_id]
+                    text = data[offset:offset + length].decode('utf-8').rstrip('\n')
+                    notes.append({'id': note_id, 'text': text.strip()})
+                return notes
+
+    def _read_compressed_notes(self, topic, index, note_ids):
+        """Read notes of a gzipped topic, seeking forward through the stream in offset order"""
+        texts = {}
+        with gzip.open(self.notes_file(topic) + COMPRESSED_SUFFIX, "rb") as file:
+            for note_id in sorted(note_ids, key=lambda n: index.live[n][0]):
+                offset, length = index.live[note_id]
+                file.seek(offset)
+                texts[note_id] = file.read(length).decode('utf-8').strip()
+        return [{'id': note_id, 'text': texts[note_id]} for note_id in note_ids]
+
+    def add_note(self, topic, text, timestamp):
+        """Append a note and return its ID"""
+        with self._topic_lock(topic):
+            note_id = self._index(topic).next_id
+            self._append(topic, note_id, self.LIVE, f"{format_note(timestamp, text)}\n".encode('utf-8'))
+            return note_id
+
+    def add_notes(self, topic, notes):
+        """Append many (text, timestamp) notes with one write to each file; returns their IDs"""
+        if not notes:
+            return []
+        with self._topic_lock(topic):
+            first_id = self._index(topic).next_id
+            _decompress_file(self.notes_file(topic))
+            with open(self.notes_file(topic), "ab") as file:
+                offset = file.seek(0, os.SEEK_END)
+                chunks = []
+                records = []
+                for note_id, (text, timestamp) in enumerate(notes, first_id):
+                    data = f"{format_note(timestamp, text)}\n".encode('utf-8')
+                    chunks.append(data)
+                    records.append(self.RECORD.pack(note_id, self.LIVE, offset, len(data)))
+                    offset += len(data)
+                file.write(b"".join(chunks))
+            with open(self.index_file(topic), "ab") as file:
+                file.write(b"".join(records))
+            self._mark_dirty(topic)
+            return list(range(first_id, first_id + len(notes)))
+
+    def list_notes(self, topic):
+        """All live notes for a topic as [{'id', 'text'}]"""
+        if not self.exists(topic):
+            return []
+        with self._topic_lock(topic):
+            return self._read_notes(topic, sorted(self._index(topic).live))
+
+    def list_notes_page(self, topic, limit, after_id=None, newest_first=False):
+        """One page of notes after a cursor; returns (notes, has_more)
+
+        Only the index is consulted to find the window; just the notes on the page
+        are read from the mapped file.
+        """
+        if not self.exists(topic):
+            return [], False
+        with self._topic_lock(topic):
+            ids = sorted(self._index(topic).live)
+            if newest_first:
+                end = bisect.bisect_left(ids, after_id) if after_id is not None else len(ids)
+                window = ids[max(end - limit - 1, 0):end][::-1]
+            else:
+                start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+                window = ids[start:start + limit + 1]
+            return self._read_notes(topic, window[:limit]), len(window) > limit
+
+    def has_note(self, topic, note_id):
+        """Whether a note ID exists in a topic"""
+        return self.exists(topic) and note_id in self._index(topic).live
+
+    def update_note(self, topic, note_id, text, timestamp):
+        """Append a new version of a note; returns False if the ID doesn't exist"""
+        with self._topic_lock(topic):
+            if not self.has_note(topic, note_id):
+                return False
+            self._append(topic, note_id, self.LIVE, f"{format_note(timestamp, text)}\n".encode('utf-8'))
+            return True
+
+    def delete_note(self, topic, note_id):
+        """Append a tombstone for a note; returns False if the ID doesn't exist"""
+        with self._topic_lock(topic):
+            if not self.has_note(topic, note_id):
+                return False
+            self._append(topic, note_id, self.TOMBSTONE)
+            return True
+
+    def search_notes(self, topic, keyword):
+        """Case-insensitive substring search within a topic"""
+        keyword = keyword.lower()
+        return [note for note in self.list_notes(topic) if keyword in note['text'].lower()]
+
+    def note_size(self, topic, note_id):
+        """Bytes one note takes in topic_stats, or None if the ID doesn't exist"""
+        if not self.exists(topic):
+            return None
+        entry = self._index(topic).live.get(note_id)
+        return entry[1] if entry else None
+
+    def topic_stats(self, topic):
+        """Note count, live bytes and on-disk size, straight from the offset index"""
+        if not self.exists(topic):
+            return {'note_count': 0, 'bytes': 0, 'disk_bytes': 0, 'compressed': False}
+        with self._topic_lock(topic):
+            live = self._index(topic).live
+            compressed = self.is_compressed(topic)
+            notes_path = self.notes_file(topic) + (COMPRESSED_SUFFIX if compressed else "")
+            disk_bytes = sum(
+                os.path.getsize(path) for path in (notes_path, self.index_file(topic)) if os.path.exists(path)
+            )
+            return {
+                'note_count': len(live),
+                'bytes': sum(length for _, length in live.values()),
+                'disk_bytes': disk_bytes,
+                'compressed': compressed
+            }
+
+    def compress_topic(self, topic):
+        """Gzip a topic's notes file (compacting first if due); the index stays as is for seeking"""
+        with self._topic_lock(topic):
+            if not os.path.exists(self.notes_file(topic)):
+                return False
+            self.compact(topic)
+            _compress_file(self.notes_file(topic))
+            logger.info(f"Compressed cold topic {topic}")
+            return True
+
+    def compress_cold_topics(self, max_age):
+        """Compress every topic not written for max_age seconds; returns their keys"""
+        cutoff = time.time() - max_age
+        compressed = []
+        for key in self.list_topics():
+            try:
+                last_write = max(os.path.getmtime(self.notes_file(key)), os.path.getmtime(self.index_file(key)))
+                if last_write < cutoff and self.compress_topic(key):
+                    compressed.append(key)
+            except OSError:
+                continue
+        return compressed
+
+    def _mark_dirty(self, topic):
+        """Queue a topic for the background compactor"""
+        with self._lock:
+            self._dirty_topics.add(topic_key(topic))
+            if self._compactor is None:
+                self._compactor = threading.Thread(
+                    target=self._compaction_loop, name='notes-compactor', daemon=True
+                )
+                self._compactor.start()
+
+    def _compaction_loop(self):
+        """Periodically compact topics that were written to"""
+        while True:
+            time.sleep(self.compact_interval)
+            with self._lock:
+                topics, self._dirty_topics = self._dirty_topics, set()
+            for key in topics:
+                try:
+                    self.compact(key)
+                except Exception as e:
+                    logger.error(f"Error compacting notes for {key}: {str(e)}")
+
+    def compact(self, topic, force=False):
+        """Rewrite a topic with only its live notes once enough records are dead"""
+        with self._topic_lock(topic):
+            index = self._index(topic)
+            dead = index.total_records - len(index.live)
+            if not force and (index.total_records < self.compact_min_records or
+                              dead / max(index.total_records, 1) < self.compact_threshold):
+                return False
+
+            if not os.path.exists(self.notes_file(topic)) or not os.path.getsize(self.notes_file(topic)):
+                return False
+
+            live = sorted(index.live)
+            notes_tmp = self.notes_file(topic) + ".compact"
+            index_tmp = self.index_file(topic) + ".compact"
+            records = []
+            offset = 0
+            with open(self.notes_file(topic), "rb") as source, open(notes_tmp, "wb") as target:
+                with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for note_id in live:
+                        old_offset, length = index.live[note_id]
+                        target.write(data[old_offset:old_offset + length])
+                        records.append(self.RECORD.pack(note_id, self.LIVE, offset, length))
+                        offset += length
+            # Keep the ID high-water mark so deleted IDs are never handed out again
+            if index.next_id - 1 not in index.live:
+                records.append(self.RECORD.pack(index.next_id - 1, self.TOMBSTONE, 0, 0))
+            with open(index_tmp, "wb") as file:
+                file.write(b"".join(records))
+
+            os.replace(notes_tmp, self.notes_file(topic))
+            os.replace(index_tmp, self.index_file(topic))
+            self._indexes.pop(topic_key(topic), None)
+            logger.info(f"Compacted {topic}: dropped {dead} dead records")
+            return True
+
+
+def migrate_text_notes(store, directory='.'):
+    """One-time import of existing *_notes.txt files into a SQLite store
+
+    Each migrated file is renamed to *_notes.txt.migrated so it is never imported twice.
+    Worker processes starting together take turns through an flock on
+    notes_migration.lock, and the store's marker row covers a crash between the import
+    and the rename.
+    """
+    if not glob.glob(os.path.join(directory, "*_notes.txt")):
+        return {}
+
+    migrated = {}
+    with open(os.path.join(directory, "notes_migration.lock"), "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        # Look again: another worker may have migrated the files while we waited
+        for path in sorted(glob.glob(os.path.join(directory, "*_notes.txt"))):
+            topic = os.path.basename(path)[:-len("_notes.txt")]
+            try:
+                count = store.import_text_file(topic, path)
+                os.replace(path, path + ".migrated")
+                if count is None:
+                    logger.info(f"{path} was already migrated; renamed it")
+                    continue
+                migrated[topic] = count
+                logger.info(f"Migrated {count} notes for topic {topic} from {path}")
+            except Exception as e:
+                logger.error(f"Error migrating {path}: {str(e)}")
+    return migrated
+
+
+def create_note_store(backend=None, base_dir='.'):
+    """Build the configured notes backend (NOTES_BACKEND = sqlite | log | text)"""
+    backend = (backend or os.getenv('NOTES_BACKEND', 'sqlite')).lower()
+    if backend == 'text':
+        return TextNoteStore(base_dir)
+    if backend == 'log':
+        return LogNoteStore(base_dir)
+    if backend == 'sqlite':
+        store = SQLiteNoteStore(os.getenv('NOTES_DB_FILE', 'notes.db'), base_dir)
+        migrate_text_notes(store, base_dir)
+        return store
+    raise ValueError(f"Unknown notes backend: {backend}")
+
+
+_note_store = None
+_note_store_lock = threading.Lock()
+
+
+def get_note_store():
+    """Get the process-wide notes store"""
+    global _note_store
+    with _note_store_lock:
+        if _note_store is None:
+            _note_store = create_note_store()
+        return _note_store
+
+
+def _stress_writer(backend, base_dir, topic, writer, count):
+    """One stress-test process: add notes, edit every 5th, delete every 7th (stable-ID stores)"""
+    store = create_note_store(backend, base_dir)
+    for i in range(count):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        note_id = store.add_note(topic, f"w{writer}-n{i}", timestamp)
+        if i % 5 == 0:
+            store.update_note(topic, note_id, f"w{writer}-n{i}-edited", timestamp)
+        elif store.stable_ids and i % 7 == 0:
+            store.delete_note(topic, note_id)
+
+
+def stress_test(backend, processes=8, notes_per_process=200, base_dir=None):
+    """Run concurrent writer processes against one topic and check that no note was lost
+
+    Returns a report dict; 'ok' is False if any note is missing, duplicated or unexpected.
+    """
+    import tempfile
+
+    base_dir = base_dir or tempfile.mkdtemp(prefix="notes_stress_")
+    topic = "Stress Test"
+    store = create_note_store(backend, base_dir)
+
+    started = time.time()
+    workers = [
+        multiprocessing.Process(target=_stress_writer, args=(backend, base_dir, topic, writer, notes_per_process))
+        for writer in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+
+    expected = set()
+    for writer in range(processes):
+        for i in range(notes_per_process):
+            if i % 5 == 0:
+                expected.add(f"w{writer}-n{i}-edited")
+            elif not (store.stable_ids and i % 7 == 0):
+                expected.add(f"w{writer}-n{i}")
+
+    found = []
+    for note in store.list_notes(topic):
+        match = NOTE_LINE.match(note['text'])
+        found.append(match.group(2) if match else note['text'])
+
+    missing = expected - set(found)
+    unexpected = set(found) - expected
+    duplicates = len(found) - len(set(found))
+    return {
+        'ok': not missing and not unexpected and not duplicates and all(w.exitcode == 0 for w in workers),
+        'backend': store.name,
+        'base_dir': base_dir,
+        'expected': len(expected),
+        'found': len(found),
+        'missing': len(missing),
+        'unexpected': len(unexpected),
+        'duplicates': duplicates,
+        'seconds': round(elapsed, 2)
+    }
+
+
+def main():
+    """CLI: python -m Parts.Notes_Storage migrate [directory]
+          python -m Parts.Notes_Storage stress [backend] [processes] [notes_per_process]"""
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == 'stress':
+        backend = sys.argv[2] if len(sys.argv) > 2 else os.getenv('NOTES_BACKEND', 'sqlite')
+        processes = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+        count = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+        report = stress_test(backend, processes, count)
+        for key, value in report.items():
+            print(f"{key}: {value}")
+        print("✅ No writes lost" if report['ok'] else "❌ Writes were lost or corrupted")
+        sys.exit(0 if report['ok'] else 1)
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'migrate':
+        directory = sys.argv[2] if len(sys.argv) > 2 else '.'
+        store = SQLiteNoteStore(os.getenv('NOTES_DB_FILE', 'notes.db'), directory)
+        migrated = migrate_text_notes(store, directory)
+        for topic, count in migrated.items():
+            print(f"✅ {topic}: {count} notes")
+        print(f"Migrated {len(migrated)} topic(s) into {store.db_file}")
+    else:
+        print("Usage: python -m Parts.Notes_Storage migrate [directory]")
+        print("       python -m Parts.Notes_Storage stress [sqlite|log|text] [processes] [notes_per_process]")
+
+
+if __name__ == "__main__":
+    main()
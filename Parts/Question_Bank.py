@@ -0,0 +1,193 @@
+"""
+Quiz Question Bank
+Features: Every parsed quiz question is kept in SQLite, indexed by topic, difficulty and type
+and deduplicated by content hash, so repeat quiz requests are served without a model call
+"""
+
+import os
+import json
+import hashlib
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "quiz_generator.log")
+
+DEFAULT_BANK_FILE = os.getenv('QUIZ_BANK_DB', 'question_bank.db')
+
+# Request quiz_type -> stored question type ('mixed' matches every type)
+QUIZ_TYPES = {'mcq': 'MCQ', 'tf': 'TF', 'short': 'SHORT'}
+
+
+def normalize_topic(topic):
+    """Bank key for a topic: case and spacing do not matter"""
+    return " ".join(str(topic).lower().split())
+
+
+def normalize_type(qtype):
+    """'[MCQ]', 'mcq ', 'True/False' -> MCQ / TF / SHORT"""
+    qtype = re.sub(r'[^A-Z]', '', str(qtype or '').upper())
+    if qtype.startswith('MCQ') or qtype.startswith('MULTIPLE'):
+        return 'MCQ'
+    if qtype.startswith('TF') or qtype.startswith('TRUE'):
+        return 'TF'
+    return 'SHORT'
+
+
+def question_hash(scope, topic, question):
+    """Content hash of a question: same wording and answer on the same topic = same question"""
+    text = " ".join(str(question.get('question', '')).lower().split())
+    answer = " ".join(str(question.get('answer', '')).lower().split())
+    key = f"{scope}\x1f{normalize_topic(topic)}\x1f{text}\x1f{answer}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class QuestionBank:
+    """SQLite store of generated questions
+
+    Questions live in a scope: 'topic' for general questions about a subject and 'notes'
+    for questions grounded in a user's notes, so the two never mix. A scope may carry a
+    version after a colon ('notes:v12', the notes fingerprint); storing questions for a new
+    version drops the topic's questions from older versions of that scope.
+    """
+
+    def __init__(self, bank_file=None):
+        """Open (or create) the bank database"""
+        self.bank_file = bank_file or DEFAULT_BANK_FILE
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scope TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    qtype TEXT NOT NULL,
+                    hash TEXT NOT NULL UNIQUE,
+                    data TEXT NOT NULL,
+                    created TEXT NOT NULL,
+                    served_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_lookup "
+                "ON questions (scope, topic, difficulty, qtype, served_count)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success"""
+        conn = sqlite3.connect(self.bank_file, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_questions(self, topic, difficulty, questions, scope='topic'):
+        """Store parsed questions; returns how many were new (duplicates are ignored)"""
+        rows = []
+        created = datetime.now().isoformat(timespec='seconds')
+        for question in questions:
+            if not question.get('question'):
+                continue
+            rows.append((
+                scope,
+                normalize_topic(topic),
+                str(difficulty).lower(),
+                normalize_type(question.get('type')),
+                question_hash(scope, topic, question),
+                json.dumps(question, ensure_ascii=False),
+                created
+            ))
+        if not rows:
+            return 0
+        with self._lock, self._connect() as conn:
+            if ':' in scope:
+                base = scope.split(':', 1)[0]
+                conn.execute(
+                    "DELETE FROM questions WHERE topic = ? AND (scope = ? OR scope LIKE ?) AND scope != ?",
+                    (normalize_topic(topic), base, base + ':%', scope)
+                )
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO questions (scope, topic, difficulty, qtype, hash, data, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            added = conn.total_changes - before
+        if added:
+            logger.info(f"Question bank: stored {added} new question(s) for {topic} ({difficulty})")
+        return added
+
+    def sample(self, topic, difficulty, quiz_type='mixed', count=5, scope='topic'):
+        """Up to `count` banked questions, least served first so repeat quizzes rotate"""
+        if count <= 0:
+            return []
+        params = [scope, normalize_topic(topic), str(difficulty).lower()]
+        where = "scope = ? AND topic = ? AND difficulty = ?"
+        qtype = QUIZ_TYPES.get(str(quiz_type).lower())
+        if qtype:
+            where += " AND qtype = ?"
+            params.append(qtype)
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, data FROM questions WHERE {where} "
+                f"ORDER BY served_count, RANDOM() LIMIT ?",
+                params + [int(count)]
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE questions SET served_count = served_count + 1 WHERE id = ?",
+                    [(row[0],) for row in rows]
+                )
+        return [json.loads(row[1]) for row in rows]
+
+    def record_request(self, requested, served):
+        """Count a quiz request as a full hit, a partial hit or a miss"""
+        with self._lock:
+            if served >= requested:
+                self.hits += 1
+            elif served:
+                self.partial += 1
+            else:
+                self.misses += 1
+
+    def get_stats(self):
+        """Bank size per scope (versions counted together) plus request counters for this process"""
+        with self._connect() as conn:
+            sizes = dict(conn.execute(
+                "SELECT CASE WHEN instr(scope, ':') THEN substr(scope, 1, instr(scope, ':') - 1) ELSE scope END "
+                "AS base, COUNT(*) FROM questions GROUP BY base"
+            ).fetchall())
+            topics = conn.execute("SELECT COUNT(DISTINCT topic) FROM questions").fetchone()[0]
+        with self._lock:
+            return {
+                'questions': sum(sizes.values()),
+                'by_scope': sizes,
+                'topics': topics,
+                'hits': self.hits,
+                'partial_hits': self.partial,
+                'misses': self.misses
+            }
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+
+def get_question_bank():
+    """Get the process-wide question bank"""
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            _bank = QuestionBank()
+        return _bank
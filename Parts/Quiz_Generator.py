@@ -7,9 +7,18 @@ import os
 import json
 import logging
 import csv
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import google.generativeai as genai
-import difflib
+from Parts.Answer_Grader import get_answer_grader
+from Parts.Gemini_Gateway import get_gateway
+from Parts.Notes_Storage import get_note_store
+from Parts.Question_Bank import get_question_bank, question_hash
+from Parts.Structured_Output import (
+    QUIZ_SCHEMA, JsonArrayStream, json_config, normalize_question, parse_json_array, use_json_output
+)
 
 # Configure logging
 logging.basicConfig(
@@ -22,95 +31,222 @@ class QuizGeneratorAI:
     def __init__(self, gemini_api_key):
         """Initialize Quiz Generator with AI"""
         self.gemini_api_key = gemini_api_key
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.gateway = get_gateway(gemini_api_key)
+        self.model = self.gateway.model('gemini-2.5-pro')
+        self.notes_store = get_note_store()
+        self.question_bank = get_question_bank()
+        self.grader = get_answer_grader()
         self.notes_dir = "notes"
         self.report_file = "quiz_reports.csv"
         os.makedirs(self.notes_dir, exist_ok=True)
+        
+        # Bounded pool for per-question feedback calls (shared by all requests). More workers
+        # than the gateway has slots for this model would only queue there and time out.
+        model_slots = self.gateway.limit_for('gemini-2.5-pro')
+        self.feedback_workers = max(1, min(int(os.getenv('QUIZ_FEEDBACK_WORKERS', str(model_slots))), model_slots))
+        self.feedback_executor = ThreadPoolExecutor(
+            max_workers=self.feedback_workers,
+            thread_name_prefix='quiz-feedback'
+        )
+        # 'parallel' = one call per question, 'batched' = one call for the whole quiz
+        self.feedback_mode = os.getenv('QUIZ_FEEDBACK_MODE', 'parallel')
+        # Class grading: distinct wrong answers explained per feedback call
+        self.class_feedback_batch = max(1, int(os.getenv('QUIZ_CLASS_FEEDBACK_BATCH', '20')))
+        self._report_lock = threading.Lock()
     
-    def generate_quiz_from_notes(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed'):
-        """Generate quiz from existing notes using AI"""
+    def generate_quiz_from_notes(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed', use_bank=True):
+        """Generate quiz from existing notes using AI (banked questions first)"""
         try:
-            filename = topic.replace(" ", "_") + "_notes.txt"
-            
-            if not os.path.exists(filename):
+            if not self.notes_store.exists(topic):
                 return {'success': False, 'message': 'No notes found for this topic'}
             
-            with open(filename, "r", encoding='utf-8') as file:
-                notes_content = file.read()
+            num_questions = int(num_questions)
+            scope = self._notes_scope(topic)
+            banked = self._from_bank(scope, topic, difficulty, quiz_type, num_questions, use_bank)
+            if len(banked) >= num_questions:
+                return self._quiz_result(topic, difficulty, quiz_type, banked, [])
+            needed = num_questions - len(banked)
+            
+            notes_content = "\n".join(note['text'] for note in self.notes_store.list_notes(topic))
             
             if not notes_content.strip():
                 return {'success': False, 'message': 'Notes are empty'}
             
-            # Generate quiz based on type
-            if quiz_type == 'mcq':
-                quiz_format = "multiple choice questions with 4 options each"
-            elif quiz_type == 'tf':
-                quiz_format = "true/false questions"
-            elif quiz_type == 'short':
-                quiz_format = "short answer questions"
-            else:  # mixed
-                quiz_format = "a mix of multiple choice, true/false, and short answer questions"
-            
-            prompt = f"""Based on these study notes for {topic}, generate {num_questions} {difficulty} difficulty {quiz_format}:
-
-{notes_content}
-
-For each question, format as:
-TYPE: [MCQ/TF/SHORT]
-Q: [question text]
-A: [correct answer]
-OPTIONS: [for MCQ: option1, option2, option3, option4]
-EXPLANATION: [brief explanation of the answer]
-
-Requirements:
-- Test understanding, not just memorization
-- Difficulty level: {difficulty}
-- Cover different parts of the notes
-- Clear, unambiguous questions
-- For MCQ, make distractors plausible"""
+            prompt = self._build_notes_quiz_prompt(topic, notes_content, needed, difficulty, quiz_type)
+            generated = self._request_questions(prompt)
             
-            response = self.model.generate_content(prompt)
-            quiz_text = response.text
+            if not generated and not banked:
+                return {'success': False, 'message': 'Failed to generate quiz'}
             
-            # Parse quiz
-            questions = self._parse_quiz_response(quiz_text)
+            self.question_bank.add_questions(topic, difficulty, generated, scope=scope)
+            return self._quiz_result(topic, difficulty, quiz_type, banked, generated, scope, needed)
+        except Exception as e:
+            logging.error(f"Error generating quiz: {str(e)}")
+            return {'success': False, 'message': str(e)}
+    
+    def generate_quiz_from_topic(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed', use_bank=True):
+        """Generate quiz on a topic without notes using AI (banked questions first)"""
+        try:
+            num_questions = int(num_questions)
+            banked = self._from_bank('topic', topic, difficulty, quiz_type, num_questions, use_bank)
+            if len(banked) >= num_questions:
+                return self._quiz_result(topic, difficulty, quiz_type, banked, [])
+            needed = num_questions - len(banked)
+            
+            prompt = self._build_topic_quiz_prompt(topic, needed, difficulty, quiz_type)
+            generated = self._request_questions(prompt)
             
-            if not questions:
+            if not generated and not banked:
                 return {'success': False, 'message': 'Failed to generate quiz'}
             
-            logging.info(f"Quiz generated for {topic}: {len(questions)} questions")
-            return {
-                'success': True,
-                'questions': questions,
-                'topic': topic,
-                'difficulty': difficulty,
-                'type': quiz_type
-            }
+            self.question_bank.add_questions(topic, difficulty, generated, scope='topic')
+            return self._quiz_result(topic, difficulty, quiz_type, banked, generated, 'topic', needed)
         except Exception as e:
             logging.error(f"Error generating quiz: {str(e)}")
             return {'success': False, 'message': str(e)}
     
-    def generate_quiz_from_topic(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed'):
-        """Generate quiz on a topic without notes using AI"""
+    def stream_quiz_from_notes(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed', use_bank=True):
+        """Stream a quiz from notes as SSE-style events, one 'question' event per question"""
         try:
-            if quiz_type == 'mcq':
-                quiz_format = "multiple choice questions with 4 options each"
-            elif quiz_type == 'tf':
-                quiz_format = "true/false questions"
-            elif quiz_type == 'short':
-                quiz_format = "short answer questions"
-            else:  # mixed
-                quiz_format = "a mix of multiple choice, true/false, and short answer questions"
-            
-            prompt = f"""Generate {num_questions} {difficulty} difficulty {quiz_format} about {topic}.
-
-For each question, format as:
+            if not self.notes_store.exists(topic):
+                yield {'event': 'error', 'data': {'message': 'No notes found for this topic'}}
+                return
+            
+            num_questions = int(num_questions)
+            scope = self._notes_scope(topic)
+            banked = self._from_bank(scope, topic, difficulty, quiz_type, num_questions, use_bank)
+            needed = num_questions - len(banked)
+            prompt = None
+            if needed > 0:
+                notes_content = "\n".join(note['text'] for note in self.notes_store.list_notes(topic))
+                if not notes_content.strip():
+                    yield {'event': 'error', 'data': {'message': 'Notes are empty'}}
+                    return
+                prompt = self._build_notes_quiz_prompt(topic, notes_content, needed, difficulty, quiz_type)
+            
+            yield from self._stream_quiz(scope, topic, difficulty, quiz_type, banked, prompt, num_questions)
+        except Exception as e:
+            logging.error(f"Error streaming quiz: {str(e)}")
+            yield {'event': 'error', 'data': {'message': str(e)}}
+    
+    def stream_quiz_from_topic(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed', use_bank=True):
+        """Stream a quiz on a topic as SSE-style events, one 'question' event per question"""
+        try:
+            num_questions = int(num_questions)
+            banked = self._from_bank('topic', topic, difficulty, quiz_type, num_questions, use_bank)
+            needed = num_questions - len(banked)
+            prompt = self._build_topic_quiz_prompt(topic, needed, difficulty, quiz_type) if needed > 0 else None
+            
+            yield from self._stream_quiz('topic', topic, difficulty, quiz_type, banked, prompt, num_questions)
+        except Exception as e:
+            logging.error(f"Error streaming quiz: {str(e)}")
+            yield {'event': 'error', 'data': {'message': str(e)}}
+    
+    def stream_ready_quiz(self, quiz):
+        """Replay an already generated quiz (e.g. from the pre-generation pool) as events"""
+        for index, question in enumerate(quiz['questions']):
+            yield {'event': 'question', 'data': {'index': index, 'question': question, 'source': 'pool'}}
+        yield {'event': 'done', 'data': {
+            'success': True,
+            'topic': quiz['topic'],
+            'difficulty': quiz['difficulty'],
+            'type': quiz['type'],
+            'count': len(quiz['questions']),
+            'pooled': True
+        }}
+    
+    def _stream_quiz(self, scope, topic, difficulty, quiz_type, banked, prompt, num_questions):
+        """Emit banked questions at once, then each generated question as soon as it is complete"""
+        started = time.time()
+        first_question_at = None
+        seen = {question_hash(scope, topic, question) for question in banked}
+        
+        for index, question in enumerate(banked):
+            yield {'event': 'question', 'data': {'index': index, 'question': question, 'source': 'bank'}}
+        
+        generated = []
+        if prompt:
+            for question in self._stream_questions(prompt):
+                key = question_hash(scope, topic, question)
+                if key in seen:
+                    continue
+                seen.add(key)
+                generated.append(question)
+                if len(banked) + len(generated) > num_questions:
+                    continue
+                if first_question_at is None:
+                    first_question_at = time.time()
+                yield {'event': 'question', 'data': {
+                    'index': len(banked) + len(generated) - 1,
+                    'question': question,
+                    'source': 'generated'
+                }}
+            self.question_bank.add_questions(topic, difficulty, generated, scope=scope)
+        
+        count = min(num_questions, len(banked) + len(generated))
+        if not count:
+            yield {'event': 'error', 'data': {'message': 'Failed to generate quiz'}}
+            return
+        
+        logging.info(f"Quiz streamed for {topic}: {count} questions ({len(banked)} from bank)")
+        yield {'event': 'done', 'data': {
+            'success': True,
+            'topic': topic,
+            'difficulty': difficulty,
+            'type': quiz_type,
+            'count': count,
+            'from_bank': len(banked),
+            'generated': count - len(banked),
+            'first_question_ms': round((first_question_at - started) * 1000) if first_question_at else None,
+            'total_ms': round((time.time() - started) * 1000)
+        }}
+    
+    def _quiz_format(self, quiz_type):
+        """Describe the requested question mix for the prompt"""
+        if quiz_type == 'mcq':
+            return "multiple choice questions with 4 options each"
+        elif quiz_type == 'tf':
+            return "true/false questions"
+        elif quiz_type == 'short':
+            return "short answer questions"
+        return "a mix of multiple choice, true/false, and short answer questions"
+    
+    def _output_instructions(self):
+        """How each question should be written out, for the current output format"""
+        if use_json_output():
+            return """Return a JSON array with one object per question:
+- type: MCQ, TF or SHORT
+- question: the question text
+- answer: the correct answer (for MCQ, exactly one of the options; for TF, True or False)
+- options: for MCQ only, the 4 options
+- explanation: brief explanation of the answer"""
+        return """For each question, format as:
 TYPE: [MCQ/TF/SHORT]
 Q: [question text]
 A: [correct answer]
 OPTIONS: [for MCQ: option1, option2, option3, option4]
-EXPLANATION: [brief explanation of the answer]
+EXPLANATION: [brief explanation of the answer]"""
+    
+    def _build_notes_quiz_prompt(self, topic, notes_content, count, difficulty, quiz_type):
+        """Prompt for a quiz grounded in the user's notes"""
+        return f"""Based on these study notes for {topic}, generate {count} {difficulty} difficulty {self._quiz_format(quiz_type)}:
+
+{notes_content}
+
+{self._output_instructions()}
+
+Requirements:
+- Test understanding, not just memorization
+- Difficulty level: {difficulty}
+- Cover different parts of the notes
+- Clear, unambiguous questions
+- For MCQ, make distractors plausible"""
+    
+    def _build_topic_quiz_prompt(self, topic, count, difficulty, quiz_type):
+        """Prompt for a quiz on a topic from general knowledge"""
+        return f"""Generate {count} {difficulty} difficulty {self._quiz_format(quiz_type)} about {topic}.
+
+{self._output_instructions()}
 
 Requirements:
 - Cover key concepts in {topic}
@@ -118,27 +254,72 @@ Requirements:
 - Difficulty level: {difficulty}
 - Clear, educational questions
 - For MCQ, make distractors plausible but clearly wrong"""
-            
-            response = self.model.generate_content(prompt)
-            quiz_text = response.text
-            
-            # Parse quiz
-            questions = self._parse_quiz_response(quiz_text)
-            
-            if not questions:
-                return {'success': False, 'message': 'Failed to generate quiz'}
-            
-            logging.info(f"Quiz generated for {topic}: {len(questions)} questions")
-            return {
-                'success': True,
-                'questions': questions,
-                'topic': topic,
-                'difficulty': difficulty,
-                'type': quiz_type
-            }
-        except Exception as e:
-            logging.error(f"Error generating quiz: {str(e)}")
-            return {'success': False, 'message': str(e)}
+    
+    def _request_questions(self, prompt):
+        """One model call -> parsed questions, in the configured output format"""
+        if use_json_output():
+            response = self.model.generate_content(prompt, generation_config=json_config(QUIZ_SCHEMA))
+            items = parse_json_array(response.text)
+            return [question for question in map(normalize_question, items) if question]
+        response = self.model.generate_content(prompt)
+        return self._parse_quiz_response(response.text)
+    
+    def _stream_questions(self, prompt):
+        """Yield each question as soon as the streamed reply contains all of it"""
+        if use_json_output():
+            parser = JsonArrayStream()
+            for text in self.model.stream_text(prompt, generation_config=json_config(QUIZ_SCHEMA)):
+                for item in parser.feed(text):
+                    question = normalize_question(item)
+                    if question:
+                        yield question
+            return
+        
+        # Text format: a question is complete once the next TYPE: line starts
+        pending = ""
+        for text in self.model.stream_text(prompt):
+            pending += text
+            cut = pending.rfind('\nTYPE:')
+            if cut > 0:
+                yield from self._parse_quiz_response(pending[:cut])
+                pending = pending[cut:]
+        yield from self._parse_quiz_response(pending)
+    
+    def _notes_scope(self, topic):
+        """Bank scope for questions from a topic's notes, keyed by the notes' current version"""
+        return f"notes:{self.notes_store.fingerprint(topic)}"
+    
+    def _from_bank(self, scope, topic, difficulty, quiz_type, num_questions, use_bank=True):
+        """Banked questions for a request (and count it as a hit, partial hit or miss)"""
+        banked = []
+        if use_bank:
+            banked = self.question_bank.sample(topic, difficulty, quiz_type, num_questions, scope)
+            self.question_bank.record_request(num_questions, len(banked))
+        return banked
+    
+    def _quiz_result(self, topic, difficulty, quiz_type, banked, generated, scope='topic', needed=0):
+        """Combine banked and freshly generated questions into the quiz response"""
+        seen = {question_hash(scope, topic, question) for question in banked}
+        fresh = []
+        for question in generated:
+            key = question_hash(scope, topic, question)
+            if key not in seen:
+                seen.add(key)
+                fresh.append(question)
+        fresh = fresh[:needed]
+        questions = banked + fresh
+        
+        logging.info(f"Quiz generated for {topic}: {len(questions)} questions "
+                     f"({len(banked)} from bank, {len(fresh)} generated)")
+        return {
+            'success': True,
+            'questions': questions,
+            'topic': topic,
+            'difficulty': difficulty,
+            'type': quiz_type,
+            'from_bank': len(banked),
+            'generated': len(fresh)
+        }
     
     def _parse_quiz_response(self, quiz_text):
         """Parse AI-generated quiz into structured format"""
@@ -172,35 +353,11 @@ Requirements:
         """Evaluate a single answer with AI feedback"""
         try:
             correct_answer = question.get('answer', '')
-            q_type = question.get('type', 'SHORT')
-            
-            # Check if answer is correct
-            if q_type == 'TF':
-                is_correct = user_answer.lower().strip() in ['true', 't'] and correct_answer.lower().strip() in ['true', 't'] or \
-                            user_answer.lower().strip() in ['false', 'f'] and correct_answer.lower().strip() in ['false', 'f']
-            elif q_type == 'MCQ':
-                is_correct = user_answer.strip().lower() == correct_answer.strip().lower()
-            else:  # SHORT
-                # Use similarity for short answers
-                similarity = difflib.SequenceMatcher(None, 
-                                                    user_answer.lower().strip(), 
-                                                    correct_answer.lower().strip()).ratio()
-                is_correct = similarity > 0.7
+            is_correct = self._check_answer(question, user_answer)
             
             # Get AI feedback if requested
             if get_feedback:
-                prompt = f"""Question: {question['question']}
-Student's Answer: {user_answer}
-Correct Answer: {correct_answer}
-Question Type: {q_type}
-
-Provide brief, encouraging feedback (2-3 sentences) that:
-{'- Praises the correct answer and reinforces the concept' if is_correct else '- Explains why the answer is incorrect'}
-{'- Explains the key concept' if not is_correct else '- Mentions a related concept or application'}
-- Is supportive and educational"""
-                
-                response = self.model.generate_content(prompt)
-                feedback = response.text
+                feedback = self._get_answer_feedback(question, user_answer, is_correct)
             else:
                 feedback = question.get('explanation', 
                                        "Correct!" if is_correct else f"The correct answer is: {correct_answer}")
@@ -218,46 +375,390 @@ Provide brief, encouraging feedback (2-3 sentences) that:
                 'correct_answer': question.get('answer', '')
             }
     
-    def evaluate_quiz(self, questions, user_answers):
+    def _check_answer(self, question, user_answer):
+        """Decide locally whether an answer is correct"""
+        return self._grade_answers([question], [user_answer])[0]
+    
+    def _grade_answers(self, questions, user_answers):
+        """Correctness of every answer: exact checks for MCQ/TF, one vectorized similarity pass for the rest"""
+        correct = [False] * len(questions)
+        batch = []
+        for i, (question, user_answer) in enumerate(zip(questions, user_answers)):
+            q_type = self._grading_type(question)
+            if q_type is None:
+                correct[i] = self._check_exact(question, user_answer)
+            else:
+                batch.append((i, q_type, str(user_answer or ''), question.get('answer', '')))
+        
+        if batch:
+            _, matches = self.grader.grade(
+                [item[1] for item in batch],
+                [item[2] for item in batch],
+                [item[3] for item in batch]
+            )
+            for item, is_correct in zip(batch, matches):
+                correct[item[0]] = bool(is_correct)
+        return correct
+    
+    def _grading_type(self, question):
+        """Question type to grade by similarity (per-type threshold), or None for an exact check"""
+        q_type = str(question.get('type') or 'SHORT').strip('[] ').upper()
+        if self.grader.uses_similarity(q_type):
+            return q_type
+        if q_type in ('TF', 'MCQ'):
+            return None
+        return 'SHORT'
+    
+    def _check_exact(self, question, user_answer):
+        """MCQ and true/false answers must match the correct answer"""
+        user_answer = str(user_answer or '')
+        correct_answer = question.get('answer', '')
+        q_type = str(question.get('type') or 'SHORT').strip('[] ').upper()
+        
+        if q_type == 'TF':
+            return user_answer.lower().strip() in ['true', 't'] and correct_answer.lower().strip() in ['true', 't'] or \
+                   user_answer.lower().strip() in ['false', 'f'] and correct_answer.lower().strip() in ['false', 'f']
+        return user_answer.strip().lower() == correct_answer.strip().lower()
+    
+    def _get_answer_feedback(self, question, user_answer, is_correct):
+        """Get AI feedback for one answer"""
+        correct_answer = question.get('answer', '')
+        q_type = question.get('type', 'SHORT')
+        
+        prompt = f"""Question: {question['question']}
+Student's Answer: {user_answer}
+Correct Answer: {correct_answer}
+Question Type: {q_type}
+
+Provide brief, encouraging feedback (2-3 sentences) that:
+{'- Praises the correct answer and reinforces the concept' if is_correct else '- Explains why the answer is incorrect'}
+{'- Explains the key concept' if not is_correct else '- Mentions a related concept or application'}
+- Is supportive and educational"""
+        
+        # Queued feedback waits for a slot as long as a call may take rather than failing fast
+        response = self.model.generate_content(prompt, queue_timeout=self.gateway.timeout)
+        return response.text
+    
+    def _safe_answer_feedback(self, question, user_answer, is_correct):
+        """(feedback, used fallback) - AI feedback, or the stored explanation if the call fails"""
+        try:
+            return self._get_answer_feedback(question, user_answer, is_correct), False
+        except Exception as e:
+            logging.error(f"Error getting answer feedback: {str(e)}")
+            return question.get('explanation',
+                                "Correct!" if is_correct else f"The correct answer is: {question.get('answer', '')}"), True
+    
+    def evaluate_quiz(self, questions, user_answers, feedback_mode=None):
         """Evaluate entire quiz and provide detailed feedback"""
         try:
-            score = 0
+            feedback_mode = feedback_mode or self.feedback_mode
             total = len(questions)
             results = []
             
+            # Grade everything locally first; only the feedback needs the model
+            correct = self._grade_answers(questions, user_answers)
             for i, (question, user_answer) in enumerate(zip(questions, user_answers)):
-                evaluation = self.evaluate_answer(question, user_answer, get_feedback=True)
-                
-                if evaluation['is_correct']:
-                    score += 1
-                
                 results.append({
                     'question_num': i + 1,
                     'question': question['question'],
                     'type': question.get('type', 'SHORT'),
                     'user_answer': user_answer,
-                    'correct_answer': evaluation['correct_answer'],
-                    'is_correct': evaluation['is_correct'],
-                    'feedback': evaluation['feedback']
+                    'correct_answer': question.get('answer', ''),
+                    'is_correct': correct[i],
+                    'feedback': None,
+                    'feedback_fallback': False
                 })
             
+            score = sum(1 for r in results if r['is_correct'])
             percentage = (score / total * 100) if total > 0 else 0
             
-            # Get overall performance feedback
-            overall_feedback = self._get_overall_feedback(percentage, results)
+            if feedback_mode == 'batched':
+                overall_feedback = self._get_batched_feedback(questions, results, percentage)
+            else:
+                # Overall feedback only needs correctness, so start it alongside the per-question calls
+                overall_future = self.feedback_executor.submit(self._get_overall_feedback, percentage, results)
+                feedback_futures = [
+                    self.feedback_executor.submit(self._safe_answer_feedback, question, r['user_answer'], r['is_correct'])
+                    for question, r in zip(questions, results)
+                ]
+                
+                for r, future in zip(results, feedback_futures):
+                    r['feedback'], r['feedback_fallback'] = future.result()
+                overall_feedback = overall_future.result()
             
+            fallbacks = sum(1 for r in results if r['feedback_fallback'])
+            if fallbacks:
+                logging.warning(f"Quiz feedback fell back to stored explanations for {fallbacks}/{total} answers")
             return {
                 'success': True,
                 'score': score,
                 'total': total,
                 'percentage': percentage,
                 'results': results,
-                'overall_feedback': overall_feedback
+                'overall_feedback': overall_feedback,
+                'fallback_feedback': fallbacks
             }
         except Exception as e:
             logging.error(f"Error evaluating quiz: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def evaluate_class(self, questions, submissions, topic='Unknown', class_feedback=True, save_reports=True):
+        """Grade a whole class at once
+        
+        All answers are graded locally in one pass. Feedback for a wrong answer is generated
+        once per distinct answer (students giving the same wrong answer share it), batched per
+        question, and every student's report is written in a single append.
+        """
+        try:
+            started = time.time()
+            total = len(questions or [])
+            if not total:
+                return {'success': False, 'message': 'No questions provided'}
+            
+            students = []
+            flat_questions = []
+            flat_answers = []
+            for index, submission in enumerate(submissions or []):
+                if isinstance(submission, dict):
+                    student = submission.get('student') or submission.get('name') or f"Student {index + 1}"
+                    answers = list(submission.get('answers') or [])
+                else:
+                    student, answers = f"Student {index + 1}", list(submission or [])
+                answers = (answers + [''] * total)[:total]
+                students.append((str(student), answers))
+                flat_questions.extend(questions)
+                flat_answers.extend(answers)
+            
+            if not students:
+                return {'success': False, 'message': 'No submissions provided'}
+            
+            correct = self._grade_answers(flat_questions, flat_answers)
+            
+            # Distinct wrong answers per question: key -> [answer as first written, students]
+            wrong = [{} for _ in questions]
+            for position, (answer, is_correct) in enumerate(zip(flat_answers, correct)):
+                key = self._answer_key(answer)
+                if key and not is_correct:
+                    entry = wrong[position % total].setdefault(key, [str(answer).strip(), 0])
+                    entry[1] += 1
+            
+            feedback, feedback_calls = self._get_class_answer_feedback(questions, wrong)
+            
+            reports = []
+            correct_counts = [0] * total
+            for index, (student, answers) in enumerate(students):
+                results = []
+                for q, (question, answer) in enumerate(zip(questions, answers)):
+                    is_correct = correct[index * total + q]
+                    correct_answer = question.get('answer', '')
+                    if is_correct:
+                        correct_counts[q] += 1
+                        text = question.get('explanation', 'Correct!')
+                    else:
+                        text = feedback.get((q, self._answer_key(answer))) or \
+                            question.get('explanation', f"The correct answer is: {correct_answer}")
+                    results.append({
+                        'question_num': q + 1,
+                        'user_answer': answer,
+                        'correct_answer': correct_answer,
+                        'is_correct': is_correct,
+                        'feedback': text
+                    })
+                score = sum(1 for r in results if r['is_correct'])
+                percentage = score / total * 100
+                reports.append({
+                    'student': student,
+                    'score': score,
+                    'total': total,
+                    'percentage': percentage,
+                    'results': results,
+                    'overall_feedback': self._fallback_overall_feedback(percentage)
+                })
+            
+            percentages = sorted(report['percentage'] for report in reports)
+            summary = {
+                'students': len(reports),
+                'average_percentage': round(sum(percentages) / len(percentages), 1),
+                'median_percentage': round(percentages[len(percentages) // 2], 1),
+                'questions': [
+                    {
+                        'question_num': q + 1,
+                        'question': question.get('question', ''),
+                        'correct_rate': round(correct_counts[q] / len(reports), 3),
+                        'common_wrong_answers': [
+                            {'answer': text, 'count': count}
+                            for text, count in sorted(wrong[q].values(), key=lambda entry: -entry[1])[:3]
+                        ]
+                    }
+                    for q, question in enumerate(questions)
+                ]
+            }
+            
+            overall = None
+            if class_feedback:
+                overall = self._get_class_overall_feedback(topic, summary)
+                feedback_calls += 1
+            
+            if save_reports:
+                self.save_quiz_reports(topic, [
+                    (report['student'], report['score'], report['total'], report['percentage'])
+                    for report in reports
+                ])
+            
+            logging.info(f"Class graded for {topic}: {len(reports)} students, {total} questions, "
+                         f"{feedback_calls} feedback calls")
+            return {
+                'success': True,
+                'topic': topic,
+                'students': reports,
+                'summary': summary,
+                'class_feedback': overall,
+                'distinct_wrong_answers': sum(len(answers) for answers in wrong),
+                'feedback_calls': feedback_calls,
+                'elapsed_ms': round((time.time() - started) * 1000)
+            }
+        except Exception as e:
+            logging.error(f"Error evaluating class: {str(e)}")
+            return {'success': False, 'message': str(e)}
+    
+    def _answer_key(self, answer):
+        """Answers that differ only in case and spacing share feedback"""
+        return " ".join(str(answer or '').lower().split())
+    
+    def _get_class_answer_feedback(self, questions, wrong):
+        """Feedback for every distinct wrong answer: {(question index, answer key): text}
+        
+        One call per question covers up to class_feedback_batch distinct answers (most common
+        first); calls run on the shared feedback pool. Returns (feedback, number of calls).
+        """
+        futures = []
+        for q, answers in enumerate(wrong):
+            ranked = sorted(answers.items(), key=lambda item: -item[1][1])
+            for start in range(0, len(ranked), self.class_feedback_batch):
+                chunk = [(key, entry[0]) for key, entry in ranked[start:start + self.class_feedback_batch]]
+                futures.append((q, self.feedback_executor.submit(self._get_wrong_answers_feedback, questions[q], chunk)))
+        
+        feedback = {}
+        for q, future in futures:
+            for key, text in future.result().items():
+                feedback[(q, key)] = text
+        return feedback, len(futures)
+    
+    def _get_wrong_answers_feedback(self, question, answers):
+        """One call explaining several different wrong answers to the same question"""
+        listed = "\n".join(f"ANSWER {i}: {text}" for i, (_, text) in enumerate(answers, 1))
+        prompt = f"""Question: {question.get('question', '')}
+Correct Answer: {question.get('answer', '')}
+
+Students gave these incorrect answers:
+{listed}
+
+Respond in exactly this format, one line per answer number above:
+FEEDBACK [answer number]: [2-3 encouraging sentences explaining why this answer is wrong and the key concept]
+
+Be supportive and educational."""
+        
+        try:
+            response = self.model.generate_content(prompt, queue_timeout=self.gateway.timeout)
+            parsed, _ = self._parse_batched_feedback(response.text)
+        except Exception as e:
+            logging.error(f"Error getting class answer feedback: {str(e)}")
+            return {}
+        return {key: parsed[i] for i, (key, _) in enumerate(answers, 1) if parsed.get(i)}
+    
+    def _get_class_overall_feedback(self, topic, summary):
+        """One assessment of the whole class, focused on the most missed questions"""
+        hardest = sorted(summary['questions'], key=lambda q: q['correct_rate'])[:3]
+        lines = []
+        for q in hardest:
+            common = ", ".join(f"\"{a['answer']}\" ({a['count']})" for a in q['common_wrong_answers'])
+            lines.append(f"- Q{q['question_num']} ({q['correct_rate'] * 100:.0f}% correct): {q['question']}"
+                         + (f"\n  Common wrong answers: {common}" if common else ""))
+        
+        prompt = f"""A class of {summary['students']} students took a quiz on {topic}. The average score was {summary['average_percentage']}%.
+
+Most missed questions:
+{chr(10).join(lines)}
+
+For the instructor, provide:
+1. Brief assessment of the class (1-2 sentences)
+2. The misconceptions behind the common wrong answers (2-3 points)
+3. What to revisit in the next class (2-3 points)"""
+        
+        try:
+            response = self.model.generate_content(prompt)
+            return response.text
+        except Exception as e:
+            logging.error(f"Error getting class feedback: {str(e)}")
+            return self._fallback_overall_feedback(summary['average_percentage'])
+    
+    def _get_batched_feedback(self, questions, results, percentage):
+        """Get feedback for every answered question plus the overall assessment in one call"""
+        answered = [r for r in results if str(r['user_answer'] or '').strip()]
+        
+        # Unanswered questions (and anything the model skips) keep the stored explanation
+        for question, r in zip(questions, results):
+            r['feedback'] = question.get('explanation',
+                                         "Correct!" if r['is_correct'] else f"The correct answer is: {r['correct_answer']}")
+        
+        blocks = []
+        for r in answered:
+            blocks.append(f"""QUESTION {r['question_num']} ({'CORRECT' if r['is_correct'] else 'INCORRECT'}, {r['type']}):
+Question: {r['question']}
+Student's Answer: {r['user_answer']}
+Correct Answer: {r['correct_answer']}""")
+        questions_text = '\n\n'.join(blocks) if blocks else 'The student did not answer any questions.'
+        
+        prompt = f"""A student scored {percentage:.1f}% on a quiz. Give feedback on each answer below and an overall assessment.
+
+{questions_text}
+
+Respond in exactly this format, one block per question number above:
+FEEDBACK [question number]: [2-3 encouraging sentences: praise and reinforce the concept if correct, explain why it is wrong and the key concept if incorrect]
+OVERALL: [1 sentence performance assessment, 2-3 specific study recommendations, 1 sentence of encouragement]
+
+Be supportive and educational."""
+        
+        try:
+            response = self.model.generate_content(prompt)
+            feedback, overall = self._parse_batched_feedback(response.text)
+        except Exception as e:
+            logging.error(f"Error getting batched feedback: {str(e)}")
+            for r in answered:
+                r['feedback_fallback'] = True
+            return self._fallback_overall_feedback(percentage)
+        
+        for r in answered:
+            if feedback.get(r['question_num']):
+                r['feedback'] = feedback[r['question_num']]
+            else:
+                r['feedback_fallback'] = True
+        
+        return overall or self._fallback_overall_feedback(percentage)
+    
+    def _parse_batched_feedback(self, text):
+        """Split a batched feedback reply into {question_num: feedback} and the overall text"""
+        feedback = {}
+        overall_lines = []
+        current = None
+        
+        for line in text.split('\n'):
+            stripped = line.strip().lstrip('*#').strip()
+            match = re.match(r'^FEEDBACK\s*\[?(\d+)\]?\s*:\**\s*(.*)$', stripped, re.IGNORECASE)
+            if match:
+                current = int(match.group(1))
+                feedback[current] = [match.group(2)]
+            elif re.match(r'^OVERALL\s*:', stripped, re.IGNORECASE):
+                current = 'overall'
+                overall_lines.append(stripped.split(':', 1)[1].strip().lstrip('*').strip())
+            elif current == 'overall':
+                overall_lines.append(line.rstrip())
+            elif current is not None:
+                feedback[current].append(line.strip())
+        
+        feedback = {num: '\n'.join(lines).strip() for num, lines in feedback.items()}
+        return feedback, '\n'.join(overall_lines).strip()
+    
     def _get_overall_feedback(self, percentage, results):
         """Generate overall performance feedback using AI"""
         try:
@@ -275,35 +776,42 @@ Provide:
 
 Be supportive and constructive."""
             
-            response = self.model.generate_content(prompt)
+            response = self.model.generate_content(prompt, queue_timeout=self.gateway.timeout)
             return response.text
         except:
-            if percentage >= 90:
-                return "Excellent work! Keep up the great study habits."
-            elif percentage >= 70:
-                return "Good job! Review the missed topics and you'll master them."
-            elif percentage >= 50:
-                return "You're making progress. Focus on understanding core concepts."
-            else:
-                return "Keep studying! Review your notes and try practice questions."
+            return self._fallback_overall_feedback(percentage)
+    
+    def _fallback_overall_feedback(self, percentage):
+        """Static overall feedback used when the AI call fails"""
+        if percentage >= 90:
+            return "Excellent work! Keep up the great study habits."
+        elif percentage >= 70:
+            return "Good job! Review the missed topics and you'll master them."
+        elif percentage >= 50:
+            return "You're making progress. Focus on understanding core concepts."
+        else:
+            return "Keep studying! Review your notes and try practice questions."
     
     def save_quiz_report(self, topic, score, total, percentage, results):
         """Save quiz results to CSV report"""
+        result = self.save_quiz_reports(topic, [(None, score, total, percentage)])
+        if result['success']:
+            logging.info(f"Quiz report saved: {topic} - {score}/{total}")
+            return {'success': True, 'message': 'Report saved successfully'}
+        return result
+    
+    def save_quiz_reports(self, topic, reports):
+        """Append many (student, score, total, percentage) reports with one write"""
         try:
-            file_exists = os.path.exists(self.report_file)
-            
-            with open(self.report_file, mode='a', newline='', encoding='utf-8') as file:
-                fieldnames = ['timestamp', 'topic', 'score', 'total', 'percentage', 'details']
-                writer = csv.DictWriter(file, fieldnames=fieldnames)
-                
-                if not file_exists:
-                    writer.writeheader()
-                
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            rows = []
+            for student, score, total, percentage in reports:
                 # Create details summary
                 details = f"{score}/{total} correct"
-                
-                writer.writerow({
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                if student:
+                    details = f"{student}: {details}"
+                rows.append({
+                    'timestamp': timestamp,
                     'topic': topic,
                     'score': score,
                     'total': total,
@@ -311,8 +819,19 @@ Be supportive and constructive."""
                     'details': details
                 })
             
-            logging.info(f"Quiz report saved: {topic} - {score}/{total}")
-            return {'success': True, 'message': 'Report saved successfully'}
+            with self._report_lock:
+                file_exists = os.path.exists(self.report_file)
+                with open(self.report_file, mode='a', newline='', encoding='utf-8') as file:
+                    fieldnames = ['timestamp', 'topic', 'score', 'total', 'percentage', 'details']
+                    writer = csv.DictWriter(file, fieldnames=fieldnames)
+                    
+                    if not file_exists:
+                        writer.writeheader()
+                    writer.writerows(rows)
+            
+            if len(rows) > 1:
+                logging.info(f"Quiz reports saved: {topic} - {len(rows)} students")
+            return {'success': True, 'message': f'{len(rows)} report(s) saved successfully'}
         except Exception as e:
             logging.error(f"Error saving report: {str(e)}")
             return {'success': False, 'message': str(e)}
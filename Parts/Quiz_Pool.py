@@ -0,0 +1,263 @@
+"""
+Quiz Pre-generation Pool
+Features: Keeps ready-made quizzes for the core course subjects topped up in the background,
+so a quiz request for them is answered without waiting on Gemini
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from Parts.Gemini_Gateway import get_gateway
+from Parts.Log_Config import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: no lease, every process refills
+    fcntl = None
+
+logger = get_logger(__name__, "quiz_generator.log")
+
+DEFAULT_POOL_FILE = os.getenv('QUIZ_POOL_DB', 'quiz_pool.db')
+
+# Subject codes used by the predefined course links -> topic used in the prompt
+SUBJECT_NAMES = {
+    'pf': 'Programming Fundamentals',
+    'ict': 'Information and Communication Technology',
+    'oop': 'Object Oriented Programming',
+    'db': 'Database Systems',
+    'os': 'Operating Systems',
+    'dsa': 'Data Structures and Algorithms',
+    'coal': 'Computer Organization and Assembly Language',
+    'ds': 'Discrete Structures'
+}
+
+
+def _env_list(name, default):
+    """Comma-separated environment setting as a list"""
+    return [item.strip().lower() for item in os.getenv(name, default).split(',') if item.strip()]
+
+
+class QuizPool:
+    """Per-(subject, difficulty, quiz type, size) queues of pre-generated quizzes
+
+    Ready quizzes live in a SQLite file shared by every worker process, so any of them can
+    serve one, but only one process per deployment refills: the one holding the lease (an
+    flock on <pool file>.lock). The others retry the lease every LEASE_RETRY seconds in
+    case the holder exits. The refill thread keeps every queue at DEPTH quizzes, starting
+    at most REFILL_PER_MINUTE generations a minute with at most CONCURRENCY running at
+    once, each as gateway background work so it never competes with user requests.
+    """
+
+    DEPTH = int(os.getenv('QUIZ_POOL_DEPTH', '2'))
+    REFILL_PER_MINUTE = float(os.getenv('QUIZ_POOL_REFILL_PER_MINUTE', '6'))
+    CONCURRENCY = int(os.getenv('QUIZ_POOL_CONCURRENCY', '1'))
+    NUM_QUESTIONS = int(os.getenv('QUIZ_POOL_QUESTIONS', '5'))
+    LEASE_RETRY = 60
+
+    def __init__(self, quiz_generator, subjects=None, difficulties=None, quiz_types=None, pool_file=None):
+        """Open the shared queues and start the refill thread (unless DEPTH is 0)"""
+        self.quiz_generator = quiz_generator
+        self.pool_file = pool_file or DEFAULT_POOL_FILE
+        self.subjects = subjects or _env_list('QUIZ_POOL_SUBJECTS', 'pf,ict,oop,db,os')
+        self.difficulties = difficulties or _env_list('QUIZ_POOL_DIFFICULTIES', 'easy,medium,hard')
+        self.quiz_types = quiz_types or _env_list('QUIZ_POOL_TYPES', 'mixed')
+
+        # Requests may name a subject by code ('oop') or by its full name
+        self._aliases = {}
+        for code in self.subjects:
+            self._aliases[code] = code
+            self._aliases[SUBJECT_NAMES.get(code, code).lower()] = code
+
+        # In-flight refills per queue (only the lease holder has any)
+        self._pending = {}
+        for code in self.subjects:
+            for difficulty in self.difficulties:
+                for quiz_type in self.quiz_types:
+                    self._pending[(code, difficulty, quiz_type, self.NUM_QUESTIONS)] = 0
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._slots = threading.BoundedSemaphore(max(1, self.CONCURRENCY))
+        self._lease = None
+        self.leader = False
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.errors = 0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ready (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    queue TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ready_queue ON ready (queue, id)")
+
+        if self.DEPTH > 0 and self.REFILL_PER_MINUTE > 0 and self._pending:
+            threading.Thread(target=self._refill_loop, name='quiz-pool-refill', daemon=True).start()
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection; commits on success"""
+        conn = sqlite3.connect(self.pool_file, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _queue_name(key):
+        """Key tuple -> the queue column value"""
+        return "|".join(str(part) for part in key)
+
+    def _levels(self):
+        """Ready quizzes per queue key"""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT queue, COUNT(*) FROM ready GROUP BY queue").fetchall())
+        return {key: counts.get(self._queue_name(key), 0) for key in self._pending}
+
+    def _take_lease(self):
+        """Try to become this deployment's refilling process"""
+        if fcntl is None:
+            return True
+        handle = open(self.pool_file + ".lock", "a")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        # Held (open) for the life of the process
+        self._lease = handle
+        return True
+
+    def _key(self, topic, num_questions, difficulty, quiz_type):
+        """Queue key for a request, or None when the pool does not cover it"""
+        code = self._aliases.get(" ".join(str(topic or '').lower().split()))
+        try:
+            key = (code, str(difficulty).lower(), str(quiz_type).lower(), int(num_questions))
+        except (TypeError, ValueError):
+            return None
+        return key if key in self._pending else None
+
+    def pop(self, topic, num_questions=5, difficulty='medium', quiz_type='mixed'):
+        """A ready quiz for this request, or None on a miss (or if the pool doesn't cover it)"""
+        key = self._key(topic, num_questions, difficulty, quiz_type)
+        if key is None:
+            return None
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, data FROM ready WHERE queue = ? ORDER BY id LIMIT 1", (self._queue_name(key),)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM ready WHERE id = ?", (row[0],))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._wake.set()
+        if row is None:
+            return None
+        result = json.loads(row[1])
+        result['topic'] = topic
+        result['pooled'] = True
+        return result
+
+    def _next_key(self):
+        """The emptiest queue still below DEPTH (counting in-flight refills), reserved for refill"""
+        levels = self._levels()
+        with self._lock:
+            best = None
+            best_level = self.DEPTH
+            for key, ready in levels.items():
+                level = ready + self._pending[key]
+                if level < best_level:
+                    best, best_level = key, level
+            if best is not None:
+                self._pending[best] += 1
+            return best
+
+    def _refill_loop(self):
+        """Wait for the lease, then start refills at the configured rate while any queue is short"""
+        while not self._take_lease():
+            time.sleep(self.LEASE_RETRY)
+        self.leader = True
+        logger.info(f"Quiz pool refills run in process {os.getpid()}")
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, self.CONCURRENCY),
+            thread_name_prefix='quiz-pool'
+        )
+        interval = 60.0 / self.REFILL_PER_MINUTE
+        while True:
+            key = self._next_key()
+            if key is None:
+                # Pops in other processes can't wake us, so look again after one interval
+                self._wake.wait(timeout=interval)
+                self._wake.clear()
+                continue
+            self._slots.acquire()
+            self._executor.submit(self._refill, key)
+            time.sleep(interval)
+
+    def _refill(self, key):
+        """Generate one quiz for a queue"""
+        code, difficulty, quiz_type, num_questions = key
+        try:
+            # Always fresh from the model: the pool should not drain the question bank
+            with get_gateway().background():
+                result = self.quiz_generator.generate_quiz_from_topic(
+                    SUBJECT_NAMES.get(code, code), num_questions, difficulty, quiz_type, use_bank=False
+                )
+            if result.get('success') and result.get('questions'):
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT INTO ready (queue, data, created) VALUES (?, ?, ?)",
+                        (self._queue_name(key), json.dumps(result, ensure_ascii=False),
+                         datetime.now().isoformat(timespec='seconds'))
+                    )
+            with self._lock:
+                if result.get('success') and result.get('questions'):
+                    self.generated += 1
+                else:
+                    self.errors += 1
+                    logger.warning(f"Quiz pool refill failed for {key}: {result.get('message')}")
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.error(f"Quiz pool refill error for {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending[key] -= 1
+            self._slots.release()
+
+    def get_stats(self):
+        """Pool fill level (shared) plus hit/miss and refill counters for this process"""
+        ready = sum(self._levels().values())
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'subjects': self.subjects,
+                'queues': len(self._pending),
+                'depth': self.DEPTH,
+                'ready': ready,
+                'capacity': len(self._pending) * self.DEPTH,
+                'refills_here': self.leader,
+                'refilling': sum(self._pending.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 3) if requests else None,
+                'generated': self.generated,
+                'errors': self.errors
+            }
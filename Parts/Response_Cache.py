@@ -0,0 +1,118 @@
+"""
+Disk-Backed AI Response Cache
+Features: Content-addressed cache for deterministic Gemini prompts, LRU eviction, per-call TTL
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "gemini_gateway.log")
+
+DEFAULT_CACHE_FILE = os.getenv('AI_CACHE_FILE', 'ai_response_cache.db')
+DEFAULT_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '2000'))
+
+
+class CachedResponse:
+    """Minimal stand-in for a Gemini response served from cache"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def make_cache_key(model_name, prompt, generation_config=None):
+    """Build a content-addressed key from (model, prompt hash, generation config)"""
+    prompt_hash = hashlib.sha256(str(prompt).encode('utf-8')).hexdigest()
+    config = json.dumps(generation_config or {}, sort_keys=True, default=str)
+    raw = f"{model_name}\n{prompt_hash}\n{config}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_file=None, max_entries=None):
+        """Initialize the on-disk cache"""
+        self.cache_file = cache_file or DEFAULT_CACHE_FILE
+        self.max_entries = max_entries or DEFAULT_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evicted': 0}
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    text TEXT,
+                    created_at REAL,
+                    expires_at REAL,
+                    last_access REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        """Open a short-lived connection (one per call keeps this safe across Flask threads)"""
+        conn = sqlite3.connect(self.cache_file, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """Return cached text for key, or None on miss/expiry"""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT text, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            text, expires_at = row
+            if expires_at and expires_at < now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.stats['hits'] += 1
+            return text
+
+    def set(self, key, text, ttl, model_name=''):
+        """Store text under key for ttl seconds, evicting least recently used entries"""
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, text, now, expires_at, now)
+            )
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (overflow,)
+                )
+                self.stats['evicted'] += overflow
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def get_stats(self):
+        """Get hit/miss counters and current size"""
+        with self._lock, self._connect() as conn:
+            size = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['entries'] = size
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
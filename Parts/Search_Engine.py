@@ -11,7 +11,8 @@ import time
 from datetime import datetime
 import speech_recognition as sr
 from deep_translator import GoogleTranslator
-import google.generativeai as genai
+from Parts.Gemini_Gateway import get_gateway
+from Parts.Semantic_Cache import get_semantic_cache
 
 # Configure logging
 logging.basicConfig(
@@ -21,11 +22,17 @@ logging.basicConfig(
 )
 
 class SearchEngineAI:
+    # Cache lifetimes (seconds) for prompts built from a small, fixed set of inputs
+    CACHE_TTLS = {
+        'music_recommendations': 24 * 3600
+    }
+
     def __init__(self, gemini_api_key):
         """Initialize Search Engine with AI"""
         self.gemini_api_key = gemini_api_key
-        genai.configure(api_key=gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.gateway = get_gateway(gemini_api_key)
+        self.model = self.gateway.model('gemini-2.5-pro')
+        self.semantic_cache = get_semantic_cache()
         self.translator = GoogleTranslator()
         self.recognizer = sr.Recognizer()
         self.todo_file = 'todo_list.json'
@@ -43,8 +50,12 @@ Provide:
 
 Format as bullet points, be concise."""
             
-            response = self.model.generate_content(prompt)
-            suggestions = response.text
+            # Reuse the answer for a near-identical query if we have one
+            suggestions = self.semantic_cache.lookup('search_suggestions', query)
+            if suggestions is None:
+                response = self.model.generate_content(prompt)
+                suggestions = response.text
+                self.semantic_cache.store('search_suggestions', query, suggestions)
             
             logging.info(f"Search suggestions generated for: {query}")
             return {
@@ -289,7 +300,7 @@ For each, provide:
 
 Focus on scientifically-backed options for focus and productivity."""
             
-            response = self.model.generate_content(prompt)
+            response = self.model.generate_content(prompt, cache_ttl=self.CACHE_TTLS['music_recommendations'])
             recommendations = response.text
             
             return {'success': True, 'recommendations': recommendations}
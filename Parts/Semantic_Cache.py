@@ -0,0 +1,162 @@
+"""
+Semantic Near-Duplicate Cache
+Features: Local (no network) similarity cache for free-text AI queries using hashed n-gram vectors
+"""
+
+import os
+import re
+import time
+import zlib
+import threading
+import numpy as np
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "gemini_gateway.log")
+
+DEFAULT_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+DEFAULT_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '1000'))
+DEFAULT_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', str(24 * 3600)))
+VECTOR_DIM = 2048
+# Queries this short only match the exact same set of words: one differing word
+# ("vitamin a" vs "vitamin") is too much of the meaning to allow a near match
+EXACT_MATCH_TOKENS = int(os.getenv('SEMANTIC_CACHE_EXACT_TOKENS', '3'))
+# Namespaces where one changed word (a drug, a condition, "with"/"without") changes the
+# answer: only the same set of content words is a hit, never a merely similar query
+STRICT_NAMESPACES = {
+    name.strip() for name in os.getenv(
+        'SEMANTIC_CACHE_STRICT_NAMESPACES', 'medical_info,medication_info'
+    ).split(',') if name.strip()
+}
+
+# Single letters are not filler: "hepatitis a", "vitamin c", "plan b". Negations
+# ("no", "not", "without", "never") are content and must never be added here.
+STOPWORDS = {
+    'an', 'and', 'the', 'of', 'or', 'for', 'with', 'in', 'on', 'to', 'is',
+    'are', 'what', 'how', 'about', 'my', 'me', 'do', 'does', 'can'
+}
+# A near match must agree on these, or "with" and "without" share an answer
+NEGATIONS = {'no', 'not', 'without', 'never', 'none', 'nor', 'cannot', 'dont', 'doesnt'}
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and filler words, and sort tokens so word order doesn't matter"""
+    tokens = re.findall(r'[a-z0-9]+', str(query).lower())
+    tokens = [t for t in tokens if t not in STOPWORDS] or tokens
+    return sorted(set(tokens))
+
+
+def vectorize(tokens, dim=VECTOR_DIM):
+    """Hash word unigrams and character trigrams into an L2-normalized vector"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokens:
+        vector[zlib.crc32(('w:' + token).encode('utf-8')) % dim] += 1.0
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            vector[zlib.crc32(('c:' + padded[i:i + 3]).encode('utf-8')) % dim] += 0.5
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class _Namespace:
+    """Vectors and answers for one kind of query"""
+
+    def __init__(self, dim):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.keys = []
+        self.answers = []
+        self.created = []
+
+
+class SemanticCache:
+    def __init__(self, threshold=None, max_entries=None, ttl=None):
+        """Initialize an in-process similarity cache"""
+        self.threshold = threshold or DEFAULT_THRESHOLD
+        self.max_entries = max_entries or DEFAULT_MAX_ENTRIES
+        self.ttl = ttl or DEFAULT_TTL
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def lookup(self, namespace, query):
+        """Return the cached answer for the nearest similar query, or None"""
+        tokens = normalize_query(query)
+        if not tokens:
+            return None
+        vector = vectorize(tokens)
+        now = time.time()
+
+        with self._lock:
+            space = self._namespaces.get(namespace)
+            if space is None or not space.keys:
+                self.stats['misses'] += 1
+                return None
+
+            scores = space.vectors @ vector
+            best = int(np.argmax(scores))
+            if namespace in STRICT_NAMESPACES or min(len(tokens), len(space.keys[best])) <= EXACT_MATCH_TOKENS:
+                # Strict namespaces and short queries: only the identical normalized query counts
+                best = space.keys.index(tokens) if tokens in space.keys else None
+            elif NEGATIONS.intersection(tokens) != NEGATIONS.intersection(space.keys[best]):
+                best = None
+            if best is not None and scores[best] >= self.threshold and now - space.created[best] <= self.ttl:
+                self.stats['hits'] += 1
+                logger.info(f"Semantic cache hit ({namespace}): '{query}' ~ '{' '.join(space.keys[best])}' ({scores[best]:.2f})")
+                return space.answers[best]
+
+            self.stats['misses'] += 1
+            return None
+
+    def store(self, namespace, query, answer):
+        """Remember the answer for a query"""
+        tokens = normalize_query(query)
+        if not tokens or not answer:
+            return
+        vector = vectorize(tokens)
+
+        with self._lock:
+            space = self._namespaces.setdefault(namespace, _Namespace(VECTOR_DIM))
+
+            # Replace an existing entry for the same normalized query
+            if tokens in space.keys:
+                idx = space.keys.index(tokens)
+                space.answers[idx] = answer
+                space.created[idx] = time.time()
+                return
+
+            # Drop the oldest entries once the namespace is full
+            if len(space.keys) >= self.max_entries:
+                drop = len(space.keys) - self.max_entries + 1
+                space.vectors = space.vectors[drop:]
+                del space.keys[:drop]
+                del space.answers[:drop]
+                del space.created[:drop]
+
+            space.vectors = np.vstack([space.vectors, vector[np.newaxis, :]])
+            space.keys.append(tokens)
+            space.answers.append(answer)
+            space.created.append(time.time())
+
+    def get_stats(self):
+        """Get hit/miss counters and entry counts"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = {name: len(space.keys) for name, space in self._namespaces.items()}
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['threshold'] = self.threshold
+        return stats
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Get the process-wide semantic cache"""
+    global _semantic_cache
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache()
+        return _semantic_cache
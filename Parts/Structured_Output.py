@@ -0,0 +1,163 @@
+"""
+Structured Model Output
+Features: JSON response schemas for quiz questions and flashcards, and an incremental parser
+that yields each array element as soon as it is complete in a streamed reply
+"""
+
+import os
+import json
+from Parts.Log_Config import get_logger
+
+logger = get_logger(__name__, "quiz_generator.log")
+
+# 'json' = schema-constrained JSON replies, 'text' = the original line-prefix format
+OUTPUT_FORMAT = os.getenv('AI_OUTPUT_FORMAT', 'json').lower()
+
+QUIZ_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'type': {'type': 'string', 'enum': ['MCQ', 'TF', 'SHORT']},
+            'question': {'type': 'string'},
+            'answer': {'type': 'string'},
+            'options': {'type': 'array', 'items': {'type': 'string'}},
+            'explanation': {'type': 'string'}
+        },
+        'required': ['type', 'question', 'answer']
+    }
+}
+
+FLASHCARD_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'front': {'type': 'string'},
+            'back': {'type': 'string'}
+        },
+        'required': ['front', 'back']
+    }
+}
+
+
+def use_json_output():
+    """Whether generators should ask for schema-constrained JSON"""
+    return OUTPUT_FORMAT == 'json'
+
+
+def json_config(schema):
+    """generation_config asking the model for JSON matching schema"""
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+
+class JsonArrayStream:
+    """Incremental parser for a streamed top-level JSON array of objects
+
+    feed() takes the next piece of text and returns the elements completed by it. Each
+    character is scanned once, so parsing a whole reply is linear in its length. Anything
+    before the opening '[' (such as a Markdown code fence) is skipped, and an element that
+    is not valid JSON is logged and dropped without affecting the ones after it.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+        self.done = False
+        self.skipped = 0
+
+    def feed(self, text):
+        """Consume more text; returns the list of newly completed elements"""
+        if self.done or not text:
+            return []
+        self._buffer += text
+        items = []
+        buffer = self._buffer
+        i = self._pos
+        end = len(buffer)
+        while i < end:
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth >= 1:
+                    self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+                if self._depth == 2:
+                    self._start = i
+            elif char in ']}':
+                if self._depth == 2 and self._start is not None:
+                    item = self._decode(buffer[self._start:i + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._start = None
+                self._depth -= 1
+                if self._depth <= 0:
+                    self.done = True
+                    i += 1
+                    break
+            i += 1
+
+        # Drop text that no pending element needs
+        keep_from = self._start if self._start is not None else i
+        self._buffer = buffer[keep_from:]
+        if self._start is not None:
+            self._start = 0
+        self._pos = i - keep_from
+        return items
+
+    def _decode(self, raw):
+        """Parse one element, or None if it is malformed or not an object"""
+        try:
+            item = json.loads(raw)
+        except ValueError:
+            item = None
+        if not isinstance(item, dict):
+            self.skipped += 1
+            logger.warning(f"Dropped malformed element in structured reply: {raw[:80]!r}")
+            return None
+        return item
+
+
+def parse_json_array(text):
+    """Every complete object in a (possibly truncated) JSON array reply"""
+    return JsonArrayStream().feed(text)
+
+
+def normalize_question(item):
+    """Structured quiz item -> the question dict the rest of the quiz code uses, or None"""
+    question = str(item.get('question') or '').strip()
+    if not question:
+        return None
+    qtype = str(item.get('type') or 'SHORT').strip().upper()
+    if qtype not in ('MCQ', 'TF', 'SHORT'):
+        qtype = 'SHORT'
+    result = {
+        'type': qtype,
+        'question': question,
+        'answer': str(item.get('answer') or '').strip()
+    }
+    options = item.get('options')
+    if qtype == 'MCQ' and isinstance(options, list):
+        result['options'] = [str(option).strip() for option in options if str(option).strip()]
+    if item.get('explanation'):
+        result['explanation'] = str(item['explanation']).strip()
+    return result
+
+
+def normalize_flashcard(item):
+    """Structured flashcard item -> {'front', 'back'}, or None"""
+    front = str(item.get('front') or '').strip()
+    if not front:
+        return None
+    return {'front': front, 'back': str(item.get('back') or '').strip()}